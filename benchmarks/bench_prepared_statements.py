@@ -0,0 +1,90 @@
+# benchmarks/bench_prepared_statements.py
+"""Compara execução simples x PREPARE/EXECUTE das verificações mais repetidas do ETL.
+
+Uso: python benchmarks/bench_prepared_statements.py [--iterations 500]
+
+Cada iteração pega uma conexão de Database.get_connection(), como as
+verificações do ETL, então a forma preparada mede o reaproveitamento do pool.
+Para cada statement mede a latência média das duas formas e o Planning Time
+reportado pelo EXPLAIN ANALYZE (na forma preparada o plano genérico passa a ser
+reaproveitado após as primeiras execuções).
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import Database
+from src.sql import compose, execute_prepared, _prepare_text
+
+
+def statements(config):
+    schema, table = config.fato_deal_target.split('.')
+    return {
+        "schema_exists": (compose(
+            "SELECT EXISTS(SELECT 1 FROM information_schema.schemata WHERE schema_name = %s)"
+        ), (schema,)),
+        "table_exists": (compose("""
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.tables
+                WHERE table_schema = %s
+                AND table_name = %s
+            )"""), (schema, table)),
+        "table_has_data": (compose(
+            "SELECT EXISTS (SELECT 1 FROM {table} LIMIT 1)", table=config.fato_deal_target
+        ), ()),
+        "invalid_etapas": (Database()._invalid_etapas_count(), ()),
+        "invalid_owners": (Database()._invalid_owners_count(), ()),
+    }
+
+
+def planning_time(cursor, query, params):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params or None)
+    return cursor.fetchone()[0][0]["Planning Time"]
+
+
+def timed(db, statement, params, iterations, use_prepared):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                execute_prepared(cursor, statement, params, use_prepared)
+                cursor.fetchall()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def bench(db, name, statement, params, iterations):
+    plain = timed(db, statement, params, iterations, use_prepared=False)
+    prepared = timed(db, statement, params, iterations, use_prepared=True)
+
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            prepared_name, _ = _prepare_text(conn, statement, bind=bool(params))
+            execute = f"EXECUTE {prepared_name}" + (f" ({', '.join(['%s'] * len(params))})" if params else "")
+            plain_planning = planning_time(cursor, statement.as_string(conn), params)
+            prepared_planning = planning_time(cursor, execute, params)
+
+    print(
+        f"{name:<16} plain {plain:8.3f} ms  prepared {prepared:8.3f} ms  "
+        f"planning {plain_planning:7.3f} -> {prepared_planning:7.3f} ms"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    db = Database()
+    for name, (statement, params) in statements(db.config).items():
+        try:
+            bench(db, name, statement, params, args.iterations)
+        except Exception as e:
+            print(f"{name:<16} skipped: {e}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
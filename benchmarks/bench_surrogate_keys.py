@@ -0,0 +1,148 @@
+# benchmarks/bench_surrogate_keys.py
+"""Compara a fato com chaves textuais x chaves substitutas inteiras.
+
+Uso: python benchmarks/bench_surrogate_keys.py [--scale 10] [--repeat 5]
+
+Monta as duas variantes num schema descartável a partir da fato publicada
+(replicada `--scale` vezes), indexa as colunas de chave e reporta tamanho da
+tabela, tamanho dos índices e a latência mediana de um star join típico.
+"""
+import os
+import sys
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import Database
+from src.sql import compose
+
+BENCH_SCHEMA = "bench_surrogate_keys"
+
+
+def natural_fact_query(db, conn):
+    """SELECT da fato publicada com as chaves naturais, qualquer que seja o layout atual"""
+    schema, table = db.config.fato_deal_target.split('.')
+    with conn.cursor() as cursor:
+        cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s
+        """, (schema, table))
+        columns = {row[0] for row in cursor.fetchall()}
+    if "etapa_id" in columns:
+        return compose("""
+        SELECT deal_id, valor, funil, etapa_id, owner_id FROM {fato}
+        """, fato=db.config.fato_deal_target)
+    return compose("""
+    SELECT f.deal_id, f.valor, f.funil, e.etapa_id, o.owner_id
+    FROM {fato} f
+    LEFT JOIN {dim_etapa} e ON e.etapa_sk = f.etapa_sk
+    LEFT JOIN {dim_owners} o ON o.owner_sk = f.owner_sk
+    """, fato=db.config.fato_deal_target,
+        dim_etapa=db.config.dim_etapa_target, dim_owners=db.config.dim_owners_target)
+
+
+def build_variants(db, conn, scale):
+    tables = {
+        "text": compose("{schema}.fato_text", schema=BENCH_SCHEMA),
+        "integer": compose("{schema}.fato_int", schema=BENCH_SCHEMA),
+    }
+    with conn.cursor() as cursor:
+        cursor.execute("SET statement_timeout = 0")
+        cursor.execute(compose("DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}", schema=BENCH_SCHEMA))
+        cursor.execute(compose("""
+        CREATE TABLE {schema}.etapa AS
+        SELECT etapa_id, row_number() OVER (ORDER BY etapa_id)::INTEGER AS etapa_sk, pipeline, etapa
+        FROM {dim_etapa};
+        CREATE TABLE {schema}.owners AS
+        SELECT owner_id, row_number() OVER (ORDER BY owner_id)::INTEGER AS owner_sk, owner_name
+        FROM {dim_owners};
+        """, schema=BENCH_SCHEMA,
+            dim_etapa=db.config.dim_etapa_target, dim_owners=db.config.dim_owners_target))
+
+        natural = natural_fact_query(db, conn)
+        cursor.execute(
+            compose("CREATE TABLE {schema}.fato_text AS SELECT n.* FROM (", schema=BENCH_SCHEMA)
+            + natural
+            + compose(") n CROSS JOIN generate_series(1, %s)", schema=BENCH_SCHEMA),
+            (scale,)
+        )
+        cursor.execute(compose("""
+        CREATE TABLE {schema}.fato_int AS
+        SELECT t.deal_id, t.valor, t.funil, e.etapa_sk, o.owner_sk
+        FROM {schema}.fato_text t
+        LEFT JOIN {schema}.etapa e USING (etapa_id)
+        LEFT JOIN {schema}.owners o USING (owner_id);
+
+        CREATE UNIQUE INDEX ON {schema}.etapa (etapa_id);
+        CREATE UNIQUE INDEX ON {schema}.etapa (etapa_sk);
+        CREATE UNIQUE INDEX ON {schema}.owners (owner_id);
+        CREATE UNIQUE INDEX ON {schema}.owners (owner_sk);
+        CREATE INDEX ON {schema}.fato_text (etapa_id);
+        CREATE INDEX ON {schema}.fato_text (owner_id);
+        CREATE INDEX ON {schema}.fato_int (etapa_sk);
+        CREATE INDEX ON {schema}.fato_int (owner_sk);
+        ANALYZE {schema}.etapa;
+        ANALYZE {schema}.owners;
+        ANALYZE {schema}.fato_text;
+        ANALYZE {schema}.fato_int;
+        """, schema=BENCH_SCHEMA))
+    return tables
+
+
+STAR_JOINS = {
+    "text": """
+    SELECT e.pipeline, o.owner_name, COUNT(*), COUNT(DISTINCT f.funil)
+    FROM {schema}.fato_text f
+    JOIN {schema}.etapa e ON e.etapa_id = f.etapa_id
+    JOIN {schema}.owners o ON o.owner_id = f.owner_id
+    GROUP BY 1, 2
+    """,
+    "integer": """
+    SELECT e.pipeline, o.owner_name, COUNT(*), COUNT(DISTINCT f.funil)
+    FROM {schema}.fato_int f
+    JOIN {schema}.etapa e ON e.etapa_sk = f.etapa_sk
+    JOIN {schema}.owners o ON o.owner_sk = f.owner_sk
+    GROUP BY 1, 2
+    """,
+}
+
+
+def measure(conn, variant, table, repeat):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_table_size(%s::regclass), pg_indexes_size(%s::regclass)",
+                       (table.as_string(conn), table.as_string(conn)))
+        table_size, index_size = cursor.fetchone()
+
+        timings = []
+        for _ in range(repeat):
+            cursor.execute(compose("EXPLAIN (ANALYZE, FORMAT JSON) " + STAR_JOINS[variant], schema=BENCH_SCHEMA))
+            timings.append(cursor.fetchone()[0][0]["Execution Time"])
+    return table_size, index_size, statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10, help="Cópias de cada linha da fato")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Mantém o schema de benchmark")
+    args = parser.parse_args(argv)
+
+    db = Database()
+    with db.get_connection() as conn:
+        conn.autocommit = True
+        try:
+            tables = build_variants(db, conn, args.scale)
+            print(f"{'keys':<8} {'table':>12} {'indexes':>12} {'star join (median)':>20}")
+            for variant, table in tables.items():
+                table_size, index_size, latency = measure(conn, variant, table, args.repeat)
+                print(f"{variant:<8} {table_size / 1024:>10.0f}kB {index_size / 1024:>10.0f}kB {latency:>17.2f} ms")
+        finally:
+            if not args.keep:
+                with conn.cursor() as cursor:
+                    cursor.execute(compose("DROP SCHEMA IF EXISTS {schema} CASCADE", schema=BENCH_SCHEMA))
+    db.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Libera conexões de replicação para o standby local (profile "replica" do docker-compose).
+# Roda só na criação do volume do primário (docker-entrypoint-initdb.d).
+set -e
+echo "host replication all all md5" >> "$PGDATA/pg_hba.conf"
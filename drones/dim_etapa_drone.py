@@ -1,37 +1,24 @@
 import sys
-import time
-import subprocess
 from pathlib import Path
-from datetime import datetime, timedelta
 
 # Adiciona o diretório pai ao path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.logger import logger
+from src.config import Config
+from src.lease import run_outcome
+from src.relay import relay_process
+from src.scheduler import run_scheduled
 
 def run_etl_process():
     """Executa o ETL para dim_etapa como subprocesso"""
     try:
-        process = subprocess.Popen(
+        result = relay_process(
             [sys.executable, "-m", "src.etl", "dim_etapa"],
-            cwd=Path(__file__).parent.parent,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
+            "dim_etapa",
+            cwd=Path(__file__).parent.parent
         )
-
-        while process.poll() is None:
-            output = process.stdout.readline()
-            error = process.stderr.readline()
-            
-            if output:
-                logger.info(f"[DIM_ETAPA] {output.strip()}")
-            if error:
-                logger.error(f"[DIM_ETAPA] {error.strip()}")
-
-        return process.returncode == 0
+        return run_outcome(result.returncode)
         
     except Exception as e:
         logger.error(f"Erro no drone dim_etapa: {str(e)}")
@@ -39,12 +26,14 @@ def run_etl_process():
 
 def main():
     logger.info("🛸 DIM_ETAPA Drone initialized - Ctrl+C to stop")
-    while True:
-        success = run_etl_process()
-        wait_time = 3600 if success else 600
-        next_run = datetime.now() + timedelta(seconds=wait_time)
-        logger.info(f"⏳ Next run in {wait_time}s at {next_run.strftime('%H:%M:%S')}")
-        time.sleep(wait_time)
+    config = Config()
+    run_scheduled(
+        "dim_etapa",
+        run_etl_process,
+        sources=[config.dim_etapa_source],
+        base_interval=3600,
+        failure_interval=600
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
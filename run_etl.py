@@ -1,81 +1,192 @@
-import subprocess
 import time
-from src.logger import logger
+from concurrent.futures import ThreadPoolExecutor
+from src.logger import logger, current_tenant, tenant_context
+from src.config import Config
 from src.database import Database
 from src.etl import build_fato_deal_query
+from src.export import export_trusted_tables
+from src.extractor import extract
+from src.health import RunState, start_health_server
+from src.lease import REUSED, run_outcome
+from src.quality import new_run_id
+from src.relay import relay_process
+from src.scheduler import AdaptiveScheduler, ChangeDetector
+from src.tenants import run_tenants
 
 class ETLPipeline:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db=None, env=None, parallelism=1, state=None):
+        self.db = db or Database()
+        # Ambiente dos subprocessos (credenciais do tenant) e dimensões simultâneas
+        self.env = env
+        self.parallelism = parallelism
+        # Estado em memória servido pelo endpoint de saúde
+        self.state = state or RunState("pipeline")
+        self.detector = ChangeDetector(self.db)
         self.dimension_processes = [
-            {"name": "dim_etapa", "cmd": ["python", "-m", "src.etl", "dim_etapa"]},
-            {"name": "dim_owners", "cmd": ["python", "-m", "src.etl", "dim_owners"]}
+            {"name": "dim_etapa", "cmd": ["python", "-m", "src.etl", "dim_etapa"],
+             "sources": [self.db.config.dim_etapa_source]},
+            {"name": "dim_owners", "cmd": ["python", "-m", "src.etl", "dim_owners"],
+             "sources": [self.db.config.dim_owners_source]}
+        ]
+        self.fact_sources = [
+            self.db.config.fato_deal_source,
+            self.db.config.dim_etapa_source,
+            self.db.config.dim_owners_source
         ]
 
     def run_dimension_process(self, process):
         """Executa um processo de dimensão como subprocesso"""
         logger.info(f"🛠 Processing {process['name']}")
-        result = subprocess.run(
-            process["cmd"],
-            capture_output=True,
-            text=True
-        )
+        with self.state.stage(process["name"]):
+            result = relay_process(process["cmd"], process["name"], env=self.env)
         
-        # Log de saída
-        if result.stdout:
-            logger.info(f"[{process['name'].upper()}] {result.stdout.strip()}")
-        if result.stderr:
-            logger.error(f"[{process['name'].upper()}] {result.stderr.strip()}")
-            
-        return result.returncode == 0
-
-    def process_fact_table(self):
+        return run_outcome(result.returncode)
+
+    def run_dimension_processes(self, pending):
+        """Executa as dimensões pendentes, em paralelo até self.parallelism"""
+        if self.parallelism <= 1 or len(pending) <= 1:
+            for process in pending:
+                yield process, self.run_dimension_process(process)
+            return
+
+        tenant = current_tenant()
+
+        def run(process):
+            with tenant_context(tenant):
+                return self.run_dimension_process(process)
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            yield from zip(pending, executor.map(run, pending))
+
+    def process_fact_table(self, run_id=None):
         """Processa a tabela fato com tratamento robusto de erros"""
         logger.info("🛠 Processing fato_deal (with fallback)")
         try:
             # Processamento principal
-            self.db.process_fact_with_fallback()
+            with self.state.stage("fato_deal"):
+                reused = self.db.process_fact_with_fallback(run_id)
 
-            # Diagnóstico de referências inválidas
-            with self.db.get_connection() as conn:
+            # Diagnóstico de referências inválidas (somente leitura, vai para a réplica)
+            with self.db.get_read_connection() as conn:
                 self.db.log_invalid_references(conn)
                 # Remova a linha abaixo
                 # self.db.validate_data_consistency(conn)
 
-            return True
+            return REUSED if reused else True
 
         except Exception as e:
             logger.error(f"❌ Critical error in fact table: {str(e)}")
             return False
 
-    def run(self):
-        """Executa o pipeline ETL completo"""
+    def extract_sources(self):
+        """Atualiza as tabelas de landing a partir da API do HubSpot"""
+        logger.info("📡 Extracting from HubSpot API")
+        try:
+            with self.state.stage("extract"):
+                extract(self.db)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Extraction failed: {str(e)}")
+            return False
+
+    def export_snapshots(self):
+        """Exporta as tabelas trusted alteradas para arquivos locais"""
+        logger.info("📦 Exporting trusted snapshots")
+        try:
+            with self.state.stage("export"):
+                export_trusted_tables(self.db)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Export failed: {str(e)}")
+            return False
+
+    def run(self, force=False):
+        """Executa o pipeline ETL completo, pulando tabelas cuja origem não mudou"""
         logger.info("🚀 Starting ETL pipeline")
         start_time = time.time()
+        self.stages_run = 0
+        run_id = new_run_id()
+
+        # Extrai da API do HubSpot para as tabelas de landing
+        if self.db.config.HUBSPOT_EXTRACT_ENABLED and not self.extract_sources():
+            return False
         
-        # Processa dimensões
+        # Processa dimensões (checkpoints retomam no primeiro estágio incompleto)
+        max_age = self.db.config.SCHEDULER_FORCE_REFRESH
+        pending, snapshots = [], {}
         for process in self.dimension_processes:
-            if not self.run_dimension_process(process):
-                logger.error(f"❌ Pipeline failed at {process['name']}")
+            snapshot = self.detector.snapshot(process["sources"])
+            if not force and not self.detector.changed(process["name"], snapshot, max_age=max_age):
+                logger.info(f"⏭ Skipping {process['name']} - source unchanged since last success")
+                continue
+            pending.append(process)
+            snapshots[process["name"]] = snapshot
+            self.detector.begin(process["name"], run_id)
+
+        failed = None
+        for process, outcome in self.run_dimension_processes(pending):
+            if not outcome:
+                self.detector.fail(process["name"], "subprocess failed")
+                failed = failed or process["name"]
+                if self.parallelism <= 1:
+                    break
+                continue
+            if outcome == REUSED:
+                self.detector.release(process["name"])
+            else:
+                self.detector.commit(process["name"], snapshots[process["name"]])
+            self.stages_run += 1
+        if failed:
+            logger.error(f"❌ Pipeline failed at {failed}")
+            return False
+
+        # Processa tabela fato; invalidada se alguma dimensão concluiu depois dela
+        snapshot = self.detector.snapshot(self.fact_sources)
+        dimensions = [process["name"] for process in self.dimension_processes]
+        if force or self.detector.changed("fato_deal", snapshot, depends_on=dimensions, max_age=max_age):
+            self.detector.begin("fato_deal", run_id)
+            outcome = self.process_fact_table(run_id)
+            if not outcome:
+                self.detector.fail("fato_deal", "fact processing failed")
                 return False
+            if outcome == REUSED:
+                self.detector.release("fato_deal")
+            else:
+                self.detector.commit("fato_deal", snapshot)
+            self.stages_run += 1
+        else:
+            logger.info("⏭ Skipping fato_deal - sources unchanged since last success")
 
-        # Processa tabela fato
-        if not self.process_fact_table():
+        # Exporta snapshots para os consumidores downstream
+        if self.db.config.EXPORT_ENABLED and not self.export_snapshots():
             return False
 
         # Log final
         duration = time.time() - start_time
-        logger.info(f"✅ ETL completed successfully in {duration:.2f} seconds")
+        logger.info(f"✅ ETL completed successfully in {duration:.2f} seconds ({self.stages_run} stages run)")
         return True
 
 def main():
+    if Config.TENANTS_FILE:
+        # Um único runner para todos os portais/bancos do arquivo de tenants
+        run_tenants(Config.TENANTS_FILE, ETLPipeline)
+        return
+
     pipeline = ETLPipeline()
+    scheduler = AdaptiveScheduler("pipeline", base_interval=3600, failure_interval=300)
+    start_health_server(pipeline.state.status)
     
     while True:
+        start = time.time()
+        pipeline.state.run_started()
         success = pipeline.run()
-        wait_time = 3600 if success else 300  # 1h if success, 5min if failed
-        logger.info(f"⏳ Next run in {wait_time} seconds...")
-        time.sleep(wait_time)
+        if success and pipeline.stages_run == 0:
+            scheduler.record_skip()
+            pipeline.state.record_skip()
+        else:
+            scheduler.record_run(success, time.time() - start)
+            pipeline.state.run_finished(success, time.time() - start)
+        scheduler.sleep()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -9,10 +9,111 @@ class Config:
     DB_NAME = os.getenv('DB_NAME')
     DB_USER = os.getenv('DB_USER')
     DB_PASSWORD = os.getenv('DB_PASSWORD')
+
+    # Pool de conexões e statements preparados (desligue com pgbouncer em modo transação)
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+    DB_USE_PREPARED = os.getenv('DB_USE_PREPARED', 'true').lower() == 'true'
+    # Réplica de leitura (sem host tudo vai para o primário); atraso aceito em segundos
+    DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST')
+    DB_REPLICA_PORT = os.getenv('DB_REPLICA_PORT')
+    DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', '30'))
+    # Espera pela réplica alcançar o primário e pausa após falha de conexão com ela
+    DB_REPLICA_CATCHUP_TIMEOUT = float(os.getenv('DB_REPLICA_CATCHUP_TIMEOUT', '5'))
+    DB_REPLICA_RETRY_INTERVAL = int(os.getenv('DB_REPLICA_RETRY_INTERVAL', '60'))
+    # Linhas buscadas por ida ao servidor em Database.stream_query
+    STREAM_ITERSIZE = int(os.getenv('STREAM_ITERSIZE', '10000'))
     
-    SOURCE_SCHEMA = "public"
-    TARGET_SCHEMA = "trusted"
+    SOURCE_SCHEMA = os.getenv('SOURCE_SCHEMA', 'public')
+    TARGET_SCHEMA = os.getenv('TARGET_SCHEMA', 'trusted')
+
+    # Execução multi-tenant (um portal/banco por entrada do arquivo JSON)
+    TENANTS_FILE = os.getenv('TENANTS_FILE')
+    TENANT_WORKERS = int(os.getenv('TENANT_WORKERS', '4'))
+
+    # Agendador adaptativo (segundos)
+    SCHEDULER_MIN_INTERVAL = int(os.getenv('SCHEDULER_MIN_INTERVAL', '600'))
+    SCHEDULER_MAX_INTERVAL = int(os.getenv('SCHEDULER_MAX_INTERVAL', '14400'))
+    SCHEDULER_MAX_BACKOFF = int(os.getenv('SCHEDULER_MAX_BACKOFF', '3600'))
+    SCHEDULER_FORCE_REFRESH = int(os.getenv('SCHEDULER_FORCE_REFRESH', '86400'))
+
+    # Endpoint HTTP de saúde/métricas dos runners (0 desliga)
+    HEALTH_PORT = int(os.getenv('HEALTH_PORT', '8080'))
+    HEALTH_MAX_STALENESS = int(os.getenv('HEALTH_MAX_STALENESS', '28800'))
+
+    # Leases entre processos (segundos). O heartbeat só é renovado entre as etapas
+    # da carga, então LEASE_TTL precisa cobrir a etapa mais longa (ex.: um VACUUM)
+    LEASE_TTL = int(os.getenv('LEASE_TTL', '300'))
+    LEASE_POLL_INTERVAL = int(os.getenv('LEASE_POLL_INTERVAL', '5'))
+    LEASE_WAIT_TIMEOUT = int(os.getenv('LEASE_WAIT_TIMEOUT', '3600'))
+
+    # Exportação de snapshots das tabelas trusted
+    EXPORT_ENABLED = os.getenv('EXPORT_ENABLED', 'false').lower() == 'true'
+    EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+    EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'parquet')
+    EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'zstd')
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '50000'))
+    # Tentativas quando a origem muda durante a exportação (fingerprint antes != depois)
+    EXPORT_CONSISTENCY_ATTEMPTS = int(os.getenv('EXPORT_CONSISTENCY_ATTEMPTS', '3'))
+
+    # Ingestão de arquivos exportados do HubSpot
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+    INGEST_CHUNK_ROWS = int(os.getenv('INGEST_CHUNK_ROWS', '10000'))
+
+    # Extração da API do HubSpot
+    HUBSPOT_TOKEN = os.getenv('HUBSPOT_TOKEN')
+    HUBSPOT_BASE_URL = os.getenv('HUBSPOT_BASE_URL', 'https://api.hubapi.com')
+    HUBSPOT_EXTRACT_ENABLED = os.getenv('HUBSPOT_EXTRACT_ENABLED', 'false').lower() == 'true'
+    HUBSPOT_MAX_CONCURRENCY = int(os.getenv('HUBSPOT_MAX_CONCURRENCY', '4'))
+    HUBSPOT_RATE_LIMIT = float(os.getenv('HUBSPOT_RATE_LIMIT', '10'))
+    HUBSPOT_MAX_RETRIES = int(os.getenv('HUBSPOT_MAX_RETRIES', '5'))
+    HUBSPOT_MAX_BACKOFF = int(os.getenv('HUBSPOT_MAX_BACKOFF', '60'))
+    HUBSPOT_TIMEOUT = int(os.getenv('HUBSPOT_TIMEOUT', '30'))
+    HUBSPOT_SEARCH_WINDOWS = int(os.getenv('HUBSPOT_SEARCH_WINDOWS', '4'))
+    HUBSPOT_QUEUE_PAGES = int(os.getenv('HUBSPOT_QUEUE_PAGES', '16'))
+    HUBSPOT_OVERLAP_SECONDS = int(os.getenv('HUBSPOT_OVERLAP_SECONDS', '300'))
+    HUBSPOT_PROP_DATA_AGENDAMENTO = os.getenv('HUBSPOT_PROP_DATA_AGENDAMENTO', 'data_agendamento')
+    HUBSPOT_PROP_ORIGEM = os.getenv('HUBSPOT_PROP_ORIGEM', 'hs_analytics_source')
+    HUBSPOT_PROP_CANAL = os.getenv('HUBSPOT_PROP_CANAL', 'hs_analytics_source_data_1')
+
+    # Layout da tabela fato: chaves substitutas inteiras no lugar de etapa_id/owner_id
+    SURROGATE_KEYS = os.getenv('SURROGATE_KEYS', 'false').lower() == 'true'
+    # nome_negocio/detalhes numa tabela lateral 1:1 (compressão aplicada a partir do PostgreSQL 14)
+    FACT_SPLIT_TEXT = os.getenv('FACT_SPLIT_TEXT', 'false').lower() == 'true'
+    FACT_TEXT_COMPRESSION = os.getenv('FACT_TEXT_COMPRESSION', 'lz4')
+
+    # Manutenção pós-carga: ANALYZE sempre, VACUUM acima da fração de tuplas mortas
+    MAINTENANCE_ENABLED = os.getenv('MAINTENANCE_ENABLED', 'true').lower() == 'true'
+    MAINTENANCE_VACUUM_THRESHOLD = float(os.getenv('MAINTENANCE_VACUUM_THRESHOLD', '0.2'))
+    # Estatísticas estendidas da fato: grupos de colunas separados por ';'
+    MAINTENANCE_EXTENDED_STATS = os.getenv('MAINTENANCE_EXTENDED_STATS', 'funil,canal,origem')
+
+    # Limites do perfil de qualidade (taxas sobre o total de linhas carregadas)
+    DQ_ENABLED = os.getenv('DQ_ENABLED', 'true').lower() == 'true'
+    DQ_MIN_ROWS = int(os.getenv('DQ_MIN_ROWS', '1'))
+    DQ_MAX_KEY_NULL_RATE = float(os.getenv('DQ_MAX_KEY_NULL_RATE', '0'))
+    DQ_MAX_DUPLICATE_RATE = float(os.getenv('DQ_MAX_DUPLICATE_RATE', '0.01'))
+    DQ_MAX_INVALID_DATE_RATE = float(os.getenv('DQ_MAX_INVALID_DATE_RATE', '0.05'))
+    DQ_MAX_INVALID_VALOR_RATE = float(os.getenv('DQ_MAX_INVALID_VALOR_RATE', '0.05'))
     
+    @classmethod
+    def with_overrides(cls, overrides):
+        """Instância com configurações sobrescritas (ex.: credenciais de um tenant).
+
+        Os valores são convertidos para o tipo do padrão da classe, como se
+        tivessem vindo do ambiente.
+        """
+        config = cls()
+        for key, value in overrides.items():
+            if not key.isupper() or not hasattr(cls, key):
+                raise KeyError(f"Configuração desconhecida: {key}")
+            default = getattr(cls, key)
+            if isinstance(value, str) and isinstance(default, bool):
+                value = value.lower() == 'true'
+            elif isinstance(value, str) and isinstance(default, (int, float)):
+                value = type(default)(value)
+            setattr(config, key, value)
+        return config
+
     @property
     def dim_etapa_source(self):
         return f"{self.SOURCE_SCHEMA}.dim_id_etapa_hubspot"
@@ -35,4 +136,52 @@ class Config:
     
     @property
     def fato_deal_target(self):
-        return f"{self.TARGET_SCHEMA}.fato_id_deal_hubspot"
\ No newline at end of file
+        return f"{self.TARGET_SCHEMA}.fato_id_deal_hubspot"
+
+    @property
+    def fato_deal_staging(self):
+        return f"{self.fato_deal_target}_temp"
+
+    @property
+    def fato_deal_text_table(self):
+        return f"{self.fato_deal_target}_texto"
+
+    @property
+    def fato_deal_text_staging(self):
+        return f"{self.fato_deal_staging}_texto"
+
+    @property
+    def fato_deal_view(self):
+        return f"{self.fato_deal_target}_completa"
+
+    @property
+    def dim_etapa_keymap(self):
+        return f"{self.TARGET_SCHEMA}.dim_id_etapa_keymap"
+
+    @property
+    def dim_owners_keymap(self):
+        return f"{self.TARGET_SCHEMA}.dim_id_owners_keymap"
+
+    @property
+    def extract_state_table(self):
+        return f"{self.SOURCE_SCHEMA}.etl_extract_state"
+
+    @property
+    def ingest_ledger_table(self):
+        return f"{self.SOURCE_SCHEMA}.etl_ingested_files"
+
+    @property
+    def run_state_table(self):
+        return f"{self.TARGET_SCHEMA}.etl_run_state"
+
+    @property
+    def maintenance_log_table(self):
+        return f"{self.TARGET_SCHEMA}.etl_maintenance_log"
+
+    @property
+    def lease_table(self):
+        return f"{self.TARGET_SCHEMA}.etl_leases"
+
+    @property
+    def dq_profile_table(self):
+        return f"{self.TARGET_SCHEMA}.dq_profile"
\ No newline at end of file
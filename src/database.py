@@ -1,46 +1,293 @@
+import time
+import uuid
+import tempfile
+import threading
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
 from contextlib import contextmanager
 from .config import Config
 from .logger import logger
+from .quality import FATO_DEAL_COLUMNS, FATO_DEAL_TEXT_COLUMNS, valid_date
+from .sql import as_sql, columns as column_list, compose, execute_prepared, ident
+
+# Membros das dimensões ausentes, anotados pela carga do staging (tabela temporária da sessão)
+INFERRED_MEMBERS_TABLE = "pg_temp.fato_membros_inferidos"
+
+
+def _batch_converter(batch_format):
+    """Conversor (colunas, linhas) -> lote no formato pedido por stream_query"""
+    if batch_format is None:
+        return None
+    if batch_format == "rows":
+        return lambda columns, rows: rows
+    if batch_format == "pandas":
+        import pandas as pd
+        return lambda columns, rows: pd.DataFrame.from_records(rows, columns=columns)
+
+    def to_columns(columns, rows):
+        return {column: list(values) for column, values in zip(columns, zip(*rows))}
+
+    if batch_format == "columns":
+        return to_columns
+    import numpy as np
+    return lambda columns, rows: {
+        column: np.asarray(values) for column, values in to_columns(columns, rows).items()
+    }
+
+
+class _IdlePool(psycopg2.pool.ThreadedConnectionPool):
+    """Pool que abre conexões sob demanda e guarda as devolvidas (até maxconn).
+
+    O pool do psycopg2 fecha toda conexão devolvida além de minconn; com
+    minconn = maxconn as conexões ociosas seguem abertas para o próximo uso.
+    """
+
+    def __init__(self, maxconn, *args, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = self.maxconn
+
 
 class Database:
-    def __init__(self):
-        self.config = Config()
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self._pool = None
+        self._replica_pool = None
+        self._replica_down_until = 0.0
+        self._text_compression = None
+        # Lease da reconstrução em andamento (src.lease.table_lease), renovado por heartbeat()
+        self.lease = None
+        self._pool_lock = threading.Lock()
+
+    def _connection_kwargs(self, replica=False):
+        kwargs = dict(
+            host=self.config.DB_HOST,
+            port=self.config.DB_PORT,
+            database=self.config.DB_NAME,
+            user=self.config.DB_USER,
+            password=self.config.DB_PASSWORD,
+            connect_timeout=10,
+            options='-c statement_timeout=30000'
+        )
+        if replica:
+            kwargs.update(host=self.config.DB_REPLICA_HOST, port=self.config.DB_REPLICA_PORT or self.config.DB_PORT)
+        return kwargs
+
+    def _get_pool(self, replica=False):
+        with self._pool_lock:
+            pool = self._replica_pool if replica else self._pool
+            if pool is None:
+                pool = _IdlePool(self.config.DB_POOL_MAX, **self._connection_kwargs(replica))
+                if replica:
+                    self._replica_pool = pool
+                else:
+                    self._pool = pool
+            return pool
+
+    def _acquire(self, replica=False):
+        """Conexão do pool (mantém os statements preparados vivos entre usos)"""
+        if self.config.DB_POOL_MAX <= 0:
+            conn = psycopg2.connect(**self._connection_kwargs(replica))
+            logger.info("Database connection established")
+            return conn
+        pool = self._get_pool(replica)
+        try:
+            return pool.getconn()
+        except psycopg2.pool.PoolError:
+            logger.warning("Connection pool exhausted, opening a dedicated connection")
+            return psycopg2.connect(**self._connection_kwargs(replica))
+
+    def _release(self, conn, replica=False):
+        pool = self._replica_pool if replica else self._pool
+        if pool is not None:
+            try:
+                if not conn.closed:
+                    # Desfaz transação pendente e estado de sessão antes de devolver. Não é
+                    # DISCARD ALL: os statements preparados (sql._prepared) ficam vivos
+                    conn.rollback()
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        cursor.execute(
+                            "CLOSE ALL; RESET ALL; SELECT pg_advisory_unlock_all(); DISCARD TEMP"
+                        )
+                    conn.autocommit = False
+                    conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+                pool.putconn(conn, close=bool(conn.closed))
+                return
+            except psycopg2.pool.PoolError:
+                pass  # conexão dedicada aberta com o pool esgotado
+            except Exception as e:
+                logger.warning(f"Discarding pooled connection: {e}")
+                pool.putconn(conn, close=True)
+                return
+        if not conn.closed:
+            conn.close()
+            logger.info("Database connection closed")
+
+    def heartbeat(self, conn=None):
+        """Renova o lease da reconstrução em andamento; chamado entre as etapas da carga"""
+        if self.lease is not None:
+            self.lease.heartbeat(conn)
+
+    def close(self):
+        """Fecha todas as conexões dos pools (primário e réplica)"""
+        for pool in (self._pool, self._replica_pool):
+            if pool is not None:
+                pool.closeall()
+        self._pool = self._replica_pool = None
     
     @contextmanager
     def get_connection(self):
         """Gerenciador de contexto para conexões seguras"""
         conn = None
         try:
-            conn = psycopg2.connect(
-                host=self.config.DB_HOST,
-                port=self.config.DB_PORT,
-                database=self.config.DB_NAME,
-                user=self.config.DB_USER,
-                password=self.config.DB_PASSWORD,
-                connect_timeout=10,
-                options='-c statement_timeout=30000'
-            )
+            conn = self._acquire()
             conn.autocommit = False
-            logger.info("Database connection established")
             yield conn
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             raise
         finally:
-            if conn and not conn.closed:
-                conn.close()
-                logger.info("Database connection closed")
+            if conn is not None:
+                self._release(conn)
 
-    def check_schema_exists(self, conn, schema_name):
-        """Check if target schema exists"""
+    def current_wal_lsn(self, conn):
+        """Posição atual do WAL no primário"""
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_lsn()::TEXT")
+            return cursor.fetchone()[0]
+
+    def _replica_lag(self, conn, min_lsn=None):
+        """(atraso em segundos, já reproduziu min_lsn); atraso None se o host não é um standby"""
+        with conn.cursor() as cursor:
+            cursor.execute("""
+            SELECT
+                pg_is_in_recovery(),
+                CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                     ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                END,
+                %s::pg_lsn IS NULL OR pg_last_wal_replay_lsn() >= %s::pg_lsn
+            """, (min_lsn, min_lsn))
+            in_recovery, lag, caught_up = cursor.fetchone()
+        conn.rollback()
+        if not in_recovery:
+            logger.warning(f"{self.config.DB_REPLICA_HOST} is not a standby")
+            return None, False
+        return (None if lag is None else float(lag)), bool(caught_up)
+
+    def _replica_connection(self, min_lsn=None):
+        """Conexão somente leitura na réplica, ou None quando a leitura deve ir ao primário.
+
+        A réplica só é usada dentro de DB_REPLICA_MAX_LAG e depois de reproduzir
+        min_lsn; espera até DB_REPLICA_CATCHUP_TIMEOUT por isso. Falhas de conexão
+        tiram a réplica de uso por DB_REPLICA_RETRY_INTERVAL.
+        """
+        if not self.config.DB_REPLICA_HOST or time.time() < self._replica_down_until:
+            return None
+        conn = None
+        lag = None
+        try:
+            conn = self._acquire(replica=True)
+            conn.autocommit = False
+            deadline = time.time() + self.config.DB_REPLICA_CATCHUP_TIMEOUT
+            while True:
+                lag, caught_up = self._replica_lag(conn, min_lsn)
+                if lag is not None and lag <= self.config.DB_REPLICA_MAX_LAG and caught_up:
+                    conn.set_session(readonly=True)
+                    return conn
+                if lag is None or time.time() >= deadline:
+                    break
+                time.sleep(0.2)
+        except psycopg2.Error as e:
+            self._replica_down_until = time.time() + self.config.DB_REPLICA_RETRY_INTERVAL
+            logger.warning(f"Replica unavailable, reading from primary: {e}")
+            if conn is not None:
+                self._release(conn, replica=True)
+            return None
+        self._release(conn, replica=True)
+        behind = "unknown lag" if lag is None else f"{lag:.1f}s behind"
+        logger.warning(f"Replica not caught up ({behind}), reading from primary")
+        return None
+
+    @contextmanager
+    def get_read_connection(self, fresh=True):
+        """Conexão para consultas somente leitura: réplica quando configurada e em dia, senão o primário.
+
+        Com fresh=True a réplica precisa ter reproduzido a posição atual do WAL
+        do primário, então a leitura enxerga tudo que o pipeline já confirmou.
+        DDL e escritas continuam em get_connection.
+        """
+        conn = None
+        if self.config.DB_REPLICA_HOST and time.time() >= self._replica_down_until:
+            min_lsn = None
+            if fresh:
+                with self.get_connection() as primary:
+                    min_lsn = self.current_wal_lsn(primary)
+            conn = self._replica_connection(min_lsn)
+        if conn is None:
+            with self.get_connection() as conn:
+                yield conn
+            return
         try:
+            yield conn
+        except Exception as e:
+            logger.error(f"Replica query failed: {e}")
+            raise
+        finally:
+            self._release(conn, replica=True)
+
+    def extract_source(self, conn, source_query):
+        """Lado de extração de uma carga: lê a origem na réplica e a materializa no primário.
+
+        As linhas vêm por COPY binário para uma tabela temporária (ON COMMIT DROP)
+        com a estrutura da origem, e a carga passa a ler dela. Sem réplica pronta
+        devolve source_query e a carga segue como INSERT ... SELECT no primário.
+        """
+        if not self.config.DB_REPLICA_HOST:
+            return source_query
+        replica = self._replica_connection(self.current_wal_lsn(conn))
+        if replica is None:
+            return source_query
+
+        buffer = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+        try:
+            try:
+                with replica.cursor() as cursor:
+                    copy = sql.SQL("COPY ({}) TO STDOUT (FORMAT binary)").format(as_sql(source_query))
+                    cursor.copy_expert(copy.as_string(cursor), buffer)
+            except psycopg2.Error as e:
+                logger.warning(f"Extraction from replica failed, reading from primary: {e}")
+                return source_query
+            finally:
+                self._release(replica, replica=True)
+
+            buffer.seek(0)
+            temp_table = f"source_{uuid.uuid4().hex[:12]}"
             with conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT EXISTS(SELECT 1 FROM information_schema.schemata WHERE schema_name = %s);",
-                    (schema_name,)
+                    compose("CREATE TEMP TABLE {temp} ON COMMIT DROP AS ", temp=temp_table)
+                    + as_sql(source_query) + sql.SQL(" WITH NO DATA")
+                )
+                cursor.copy_expert(
+                    compose("COPY {temp} FROM STDIN (FORMAT binary)", temp=temp_table).as_string(cursor), buffer
                 )
+                logger.info(f"{cursor.rowcount} source rows extracted from replica")
+        finally:
+            buffer.close()
+        return compose("SELECT * FROM {temp}", temp=temp_table)
+
+    def _execute_prepared(self, cursor, statement, params=()):
+        """execute_prepared respeitando o DB_USE_PREPARED desta configuração (ex.: do tenant)"""
+        return execute_prepared(cursor, statement, params, self.config.DB_USE_PREPARED)
+
+    def check_schema_exists(self, conn, schema_name):
+        """Check if target schema exists"""
+        try:
+            with conn.cursor() as cursor:
+                self._execute_prepared(cursor, compose(
+                    "SELECT EXISTS(SELECT 1 FROM information_schema.schemata WHERE schema_name = %s)"
+                ), (schema_name,))
                 return cursor.fetchone()[0]
         except Exception as e:
             logger.error(f"Error checking schema: {e}")
@@ -51,12 +298,12 @@ class Database:
         try:
             schema, table = table_name.split('.') if '.' in table_name else ('public', table_name)
             with conn.cursor() as cursor:
-                cursor.execute("""
+                self._execute_prepared(cursor, compose("""
                     SELECT EXISTS (
                         SELECT 1 FROM information_schema.tables 
                         WHERE table_schema = %s 
                         AND table_name = %s
-                    )""", (schema, table))
+                    )"""), (schema, table))
                 return cursor.fetchone()[0]
         except Exception as e:
             logger.error(f"Error checking table existence: {e}")
@@ -66,16 +313,16 @@ class Database:
         """Validate dimension data before processing fact"""
         with conn.cursor() as cursor:
             # Check for NULL or empty keys in dimensions
-            cursor.execute(f"""
-            SELECT COUNT(*) FROM {db.config.dim_etapa_target} 
+            cursor.execute(compose("""
+            SELECT COUNT(*) FROM {dim_etapa} 
             WHERE etapa_id IS NULL OR etapa_id = ''
-            """)
+            """, dim_etapa=db.config.dim_etapa_target))
             null_etapas = cursor.fetchone()[0]
             
-            cursor.execute(f"""
-            SELECT COUNT(*) FROM {db.config.dim_owners_target} 
+            cursor.execute(compose("""
+            SELECT COUNT(*) FROM {dim_owners} 
             WHERE owner_id IS NULL OR owner_id = ''
-            """)
+            """, dim_owners=db.config.dim_owners_target))
             null_owners = cursor.fetchone()[0]
             
             if null_etapas > 0 or null_owners > 0:
@@ -87,7 +334,7 @@ class Database:
         """Create target schema if not exists"""
         try:
             with conn.cursor() as cursor:
-                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name};")
+                cursor.execute(compose("CREATE SCHEMA IF NOT EXISTS {schema}", schema=schema_name))
                 conn.commit()
                 logger.info(f"Schema {schema_name} created/verified")
         except Exception as e:
@@ -97,13 +344,13 @@ class Database:
     def create_dim_etapa_table(self, conn):
         """Cria a tabela dim_etapa de forma idempotente"""
         try:
-            create_table_query = f"""
-            CREATE TABLE IF NOT EXISTS {self.config.dim_etapa_target} (
+            create_table_query = compose("""
+            CREATE TABLE IF NOT EXISTS {dim_etapa} (
                 etapa_id TEXT PRIMARY KEY,
                 pipeline TEXT,
                 etapa TEXT
             );
-            """
+            """, dim_etapa=self.config.dim_etapa_target)
             with conn.cursor() as cursor:
                 cursor.execute(create_table_query)
                 conn.commit()
@@ -115,11 +362,11 @@ class Database:
     def create_dim_owners_table(self, conn):
         """Create dim_owners table if not exists"""
         try:
-            create_table_query = f"""
-            CREATE TABLE IF NOT EXISTS {self.config.dim_owners_target} (
+            create_table_query = compose("""
+            CREATE TABLE IF NOT EXISTS {dim_owners} (
                 owner_id TEXT PRIMARY KEY,
                 owner_name TEXT
-            );"""
+            );""", dim_owners=self.config.dim_owners_target)
             
             with conn.cursor() as cursor:
                 cursor.execute(create_table_query)
@@ -129,28 +376,52 @@ class Database:
             logger.error(f"Error creating table: {e}")
             raise
 
-    def create_fato_deal_table(self, conn):
+    def _fato_deal_columns(self, table_name):
+        """(coluna, tipo, expressão sobre a origem `s`) gravadas na carga da fato.
+
+        Com FACT_SPLIT_TEXT os textos ficam na tabela lateral. Com SURROGATE_KEYS
+        etapa_sk/owner_sk saem do key map na própria carga; o staging mantém
+        etapa_id/owner_id para o perfil, e a publicação remove essas colunas.
+        """
+        surrogate = self.config.SURROGATE_KEYS
+        natural_keys = not surrogate or table_name == self.config.fato_deal_staging
+        columns = []
+        for column in FATO_DEAL_COLUMNS:
+            if self.config.FACT_SPLIT_TEXT and column in FATO_DEAL_TEXT_COLUMNS:
+                continue
+            if surrogate and column in ("etapa_id", "owner_id"):
+                dimension = column[:-len("_id")]
+                if natural_keys:
+                    columns.append((column, "TEXT", f"s.{column}"))
+                columns.append((
+                    f"{dimension}_sk", "INTEGER",
+                    f"COALESCE(k_{dimension}.{dimension}_sk, new_{dimension}.{dimension}_sk)"
+                ))
+                continue
+            columns.append((column, "TEXT", f"s.{column}"))
+        return columns
+
+    def _text_table(self, fact_table):
+        """Tabela lateral de textos que acompanha a fato (publicada ou staging)"""
+        if fact_table == self.config.fato_deal_staging:
+            return self.config.fato_deal_text_staging
+        return self.config.fato_deal_text_table
+
+    def create_fato_deal_table(self, conn, table_name=None):
         """Create fato_deal table with TEXT types initially"""
+        table_name = table_name or self.config.fato_deal_target
         try:
-            create_table_query = f"""
-            DROP TABLE IF EXISTS {self.config.fato_deal_target} CASCADE;
-            CREATE TABLE {self.config.fato_deal_target} (
-                deal_id TEXT,
-                data_negocio_criado TEXT,
-                data_agendamento TEXT,
-                nome_negocio TEXT,
-                etapa_id TEXT,
-                valor TEXT,
-                funil TEXT,
-                origem TEXT,
-                canal TEXT,
-                detalhes TEXT,
-                owner_id TEXT
-            );"""
+            create_table_query = compose("DROP TABLE IF EXISTS {fato} CASCADE; CREATE TABLE {fato} (", fato=table_name) \
+                + sql.SQL(", ").join(
+                    sql.SQL("{} " + column_type).format(sql.Identifier(column))
+                    for column, column_type, _ in self._fato_deal_columns(table_name)
+                ) + sql.SQL(")")
             with conn.cursor() as cursor:
                 cursor.execute(create_table_query)
+                if self.config.FACT_SPLIT_TEXT:
+                    self._create_text_table(cursor, self._text_table(table_name))
                 conn.commit()
-            logger.info(f"Table {self.config.fato_deal_target} created with TEXT types")
+            logger.info(f"Table {table_name} created with TEXT types")
         except Exception as e:
             logger.error(f"Error creating table: {e}")
             raise
@@ -169,12 +440,52 @@ class Database:
             logger.error(f"Error executing query: {e}")
             raise
 
+    def stream_query(self, conn, query, params=None, itersize=None, batch_format=None, cursor_factory=None):
+        """Versão em streaming de execute_query usando cursor nomeado (server-side).
+
+        Sem batch_format gera uma linha por vez; com batch_format gera um lote de
+        até itersize linhas por vez: 'rows' (lista de tuplas), 'columns' (dict
+        coluna -> lista), 'numpy' (dict coluna -> ndarray) ou 'pandas' (DataFrame).
+        O cursor é fechado no servidor mesmo se o consumidor parar no meio.
+        A conexão não pode estar em autocommit (o cursor vive na transação).
+        """
+        if batch_format not in (None, "rows", "columns", "numpy", "pandas"):
+            raise ValueError(f"batch_format inválido: {batch_format}")
+        itersize = itersize or self.config.STREAM_ITERSIZE
+        to_batch = _batch_converter(batch_format)
+
+        cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=cursor_factory)
+        try:
+            cursor.itersize = itersize
+            cursor.execute(query, params or None)
+            columns = None
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                if to_batch is None:
+                    yield from rows
+                    continue
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description]
+                yield to_batch(columns, rows)
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}")
+            raise
+        finally:
+            try:
+                cursor.close()
+            except psycopg2.Error as e:
+                # Transação abortada: o cursor já morreu junto com ela
+                logger.warning(f"Could not close streaming cursor: {e}")
+
     def truncate_and_insert(self, conn, target_table, source_query):
         """Truncate and insert data safely"""
         try:
+            source_query = self.extract_source(conn, source_query)
             with conn.cursor() as cursor:
-                cursor.execute(f"TRUNCATE TABLE {target_table}")
-                cursor.execute(f"INSERT INTO {target_table} {source_query}")
+                cursor.execute(compose("TRUNCATE TABLE {target}", target=target_table))
+                cursor.execute(compose("INSERT INTO {target} ", target=target_table) + as_sql(source_query))
                 conn.commit()
             logger.info(f"Data loaded into {target_table}")
         except Exception as e:
@@ -182,13 +493,113 @@ class Database:
             logger.error(f"Failed to load data: {e}")
             raise
 
+    def load_fato_deal_rows(self, conn, table_name, source_query):
+        """Carrega a fato numa única passada pela origem.
+
+        Com FACT_SPLIT_TEXT grava a tabela lateral no mesmo comando. No staging
+        guarda também, numa tabela temporária da sessão, os etapa_id/owner_id
+        ausentes das dimensões para a publicação criar os membros inferidos.
+        Com SURROGATE_KEYS as chaves novas entram no key map no mesmo comando.
+        """
+        split = self.config.FACT_SPLIT_TEXT
+        staging = table_name == self.config.fato_deal_staging
+        side = self._text_table(table_name)
+        try:
+            source_query = self.extract_source(conn, source_query)
+            with conn.cursor() as cursor:
+                cursor.execute(compose("TRUNCATE TABLE {fato}", fato=table_name))
+                statement = sql.SQL("WITH source AS MATERIALIZED (") + as_sql(source_query) + sql.SQL(")")
+                if split:
+                    cursor.execute(compose("TRUNCATE TABLE {side}", side=side))
+                    statement += compose("""
+                ,side AS (
+                    INSERT INTO {side} (deal_id, nome_negocio, detalhes)
+                    SELECT deal_id, nome_negocio, detalhes FROM source
+                )""", side=side)
+                if staging:
+                    cursor.execute(compose("""
+                    DROP TABLE IF EXISTS {missing};
+                    CREATE TEMP TABLE {missing} (dimension TEXT NOT NULL, member_id TEXT NOT NULL);
+                    """, missing=INFERRED_MEMBERS_TABLE))
+                    statement += compose("""
+                ,missing AS (
+                    INSERT INTO {missing} (dimension, member_id)
+                    SELECT DISTINCT 'etapa', s.etapa_id FROM source s
+                    WHERE s.etapa_id IS NOT NULL
+                    AND NOT EXISTS (SELECT 1 FROM {dim_etapa} d WHERE d.etapa_id = s.etapa_id)
+                    UNION ALL
+                    SELECT DISTINCT 'owner', s.owner_id FROM source s
+                    WHERE s.owner_id IS NOT NULL
+                    AND NOT EXISTS (SELECT 1 FROM {dim_owners} d WHERE d.owner_id = s.owner_id)
+                )""", missing=INFERRED_MEMBERS_TABLE,
+                        dim_etapa=self.config.dim_etapa_target, dim_owners=self.config.dim_owners_target)
+                joins = sql.SQL("")
+                if self.config.SURROGATE_KEYS:
+                    self._create_keymaps(cursor)
+                    for _, keymap, key, sk in self._dimension_keys():
+                        dimension = key[:-len("_id")]
+                        statement += compose(f"""
+                ,new_{dimension} AS (
+                    INSERT INTO {{keymap}} ({{key}})
+                    SELECT DISTINCT {{key}} FROM source WHERE {{key}} IS NOT NULL
+                    ON CONFLICT ({{key}}) DO NOTHING
+                    RETURNING {{sk}}, {{key}}
+                )""", keymap=keymap, key=key, sk=sk)
+                        joins += compose(f"""
+                LEFT JOIN {{keymap}} k_{dimension} ON k_{dimension}.{{key}} = s.{{key}}
+                LEFT JOIN new_{dimension} ON new_{dimension}.{{key}} = s.{{key}}""", keymap=keymap, key=key)
+                columns = self._fato_deal_columns(table_name)
+                statement += compose("\n                INSERT INTO {fato} (", fato=table_name) \
+                    + column_list([column for column, _, _ in columns]) + sql.SQL(") SELECT ") \
+                    + sql.SQL(", ").join(sql.SQL(expression) for _, _, expression in columns) \
+                    + sql.SQL(" FROM source s") + joins
+                cursor.execute(statement)
+                conn.commit()
+            logger.info(f"Data loaded into {table_name}" + (f" and {side}" if split else ""))
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to load data: {e}")
+            raise
+
+    def insert_inferred_members(self, cursor):
+        """Cria nas dimensões os etapa_id/owner_id ausentes anotados pela carga do staging.
+
+        Entram como 'DESCONHECIDO' antes das FKs; a carga real da dimensão
+        sobrescreve o placeholder depois. Não confirma a transação: roda dentro
+        da publicação, só depois que o perfil de qualidade aprovou a carga.
+        """
+        cursor.execute(compose("""
+        WITH inferred_etapas AS (
+            INSERT INTO {dim_etapa} (etapa_id, pipeline, etapa)
+            SELECT member_id, 'DESCONHECIDO', 'DESCONHECIDO'
+            FROM {missing}
+            WHERE dimension = 'etapa'
+            ON CONFLICT (etapa_id) DO NOTHING
+            RETURNING 1
+        ),
+        inferred_owners AS (
+            INSERT INTO {dim_owners} (owner_id, owner_name)
+            SELECT member_id, 'DESCONHECIDO'
+            FROM {missing}
+            WHERE dimension = 'owner'
+            ON CONFLICT (owner_id) DO NOTHING
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM inferred_etapas), (SELECT COUNT(*) FROM inferred_owners)
+        """, missing=INFERRED_MEMBERS_TABLE,
+            dim_etapa=self.config.dim_etapa_target,
+            dim_owners=self.config.dim_owners_target))
+        etapas, owners = cursor.fetchone()
+        if etapas or owners:
+            logger.warning(f"Membros inferidos criados: {etapas} etapas, {owners} owners")
+
     def recreate_fato_table(self, conn):
         """Recria a tabela com estrutura definitiva usando DATE para datas sem hora"""
         try:
             with conn.cursor() as cursor:
-                cursor.execute(f"DROP TABLE IF EXISTS {self.config.fato_deal_target} CASCADE")
-                cursor.execute(f"""
-                CREATE TABLE {self.config.fato_deal_target} (
+                cursor.execute(compose("DROP TABLE IF EXISTS {fato} CASCADE", fato=self.config.fato_deal_target))
+                cursor.execute(compose("""
+                CREATE TABLE {fato} (
                     deal_id TEXT PRIMARY KEY,
                     data_negocio_criado DATE,  -- Alterado para DATE
                     data_agendamento DATE,     -- Alterado para DATE
@@ -200,7 +611,7 @@ class Database:
                     canal TEXT,
                     detalhes TEXT,
                     owner_id TEXT
-                );""")
+                );""", fato=self.config.fato_deal_target))
                 conn.commit()
             logger.info(f"Tabela {self.config.fato_deal_target} recriada com tipos DATE")
         except Exception as e:
@@ -212,31 +623,24 @@ class Database:
         """Conversão para tipos definitivos (DATE para datas)"""
         try:
             with conn.cursor() as cursor:
-                # Converter para DATE (formato YYYY-MM-DD)
-                cursor.execute(f"""
-                ALTER TABLE {self.config.fato_deal_target}
-                ALTER COLUMN data_negocio_criado TYPE DATE USING (
-                    CASE
-                        WHEN data_negocio_criado ~ '^\d{{4}}-\d{{2}}-\d{{2}}$' 
-                            THEN data_negocio_criado::DATE
-                        ELSE NULL
-                    END
-                );
-                
-                ALTER TABLE {self.config.fato_deal_target}
-                ALTER COLUMN data_agendamento TYPE DATE USING (
-                    CASE
-                        WHEN data_agendamento ~ '^\d{{4}}-\d{{2}}-\d{{2}}$' 
-                            THEN data_agendamento::DATE
-                        ELSE NULL
-                    END
-                );
-                
-                -- Conversão do valor monetário mantida
-                ALTER TABLE {self.config.fato_deal_target}
+                # Converter para DATE (formato YYYY-MM-DD); datas não convertíveis viram NULL
+                cursor.execute(sql.SQL("""
+                ALTER TABLE {fato}
+                    ALTER COLUMN data_negocio_criado TYPE DATE USING ({data_negocio_criado})::DATE,
+                    ALTER COLUMN data_agendamento TYPE DATE USING ({data_agendamento})::DATE
+                """).format(
+                    fato=ident(self.config.fato_deal_target),
+                    data_negocio_criado=valid_date("data_negocio_criado"),
+                    data_agendamento=valid_date("data_agendamento"),
+                ))
+                conn.commit()
+
+                # Conversão do valor monetário mantida (à parte, para não desfazer as datas)
+                cursor.execute(compose("""
+                ALTER TABLE {fato}
                 ALTER COLUMN valor TYPE NUMERIC(15,2) USING (
                     NULLIF(regexp_replace(valor, '[^0-9.-]', '', 'g'), '')::NUMERIC
-                );""")
+                );""", fato=self.config.fato_deal_target))
                 
                 conn.commit()
             logger.info("Conversão para DATE concluída com sucesso")
@@ -249,46 +653,58 @@ class Database:
         """Check if table exists"""
         try:
             with conn.cursor() as cursor:
-                cursor.execute(f"""
+                self._execute_prepared(cursor, compose("""
                 SELECT EXISTS (
                     SELECT 1 FROM information_schema.tables 
-                    WHERE table_schema = 'trusted' 
+                    WHERE table_schema = %s 
                     AND table_name = %s
-                )""", (table_name.split('.')[-1],))
+                )"""), (self.config.TARGET_SCHEMA, table_name.split('.')[-1]))
                 return cursor.fetchone()[0]
         except Exception as e:
             logger.error(f"Error checking table: {e}")
             return False
 
+    def _reference_keys(self):
+        """Colunas da fato que referenciam as dimensões (etapa, owner) no layout atual"""
+        return ("etapa_sk", "owner_sk") if self.config.SURROGATE_KEYS else ("etapa_id", "owner_id")
+
+    def _invalid_etapas_count(self):
+        return compose("""
+        SELECT COUNT(*) FROM {fato} f
+        WHERE f.{key} IS NOT NULL 
+        AND NOT EXISTS (SELECT 1 FROM {dim_etapa} d WHERE d.{key} = f.{key})
+        """, fato=self.config.fato_deal_target, dim_etapa=self.config.dim_etapa_target,
+            key=self._reference_keys()[0])
+
+    def _invalid_owners_count(self):
+        return compose("""
+        SELECT COUNT(*) FROM {fato} f
+        WHERE f.{key} IS NOT NULL 
+        AND NOT EXISTS (SELECT 1 FROM {dim_owners} d WHERE d.{key} = f.{key})
+        """, fato=self.config.fato_deal_target, dim_owners=self.config.dim_owners_target,
+            key=self._reference_keys()[1])
+
     def add_foreign_keys(self, conn):
-        """Adiciona FKs com verificação adicional"""
+        """Adiciona as FKs da fato para as dimensões"""
+        etapa_key, owner_key = self._reference_keys()
         try:
             with conn.cursor() as cursor:
-                # Verifica se ainda existem referências inválidas
-                cursor.execute(f"""
-                SELECT COUNT(*) FROM {self.config.fato_deal_target}
-                WHERE etapa_id IS NOT NULL 
-                AND etapa_id NOT IN (
-                    SELECT etapa_id FROM {self.config.dim_etapa_target}
-                )
-                """)
-                invalid_etapas = cursor.fetchone()[0]
-                
-                if invalid_etapas > 0:
-                    raise Exception(f"Still found {invalid_etapas} invalid etapa references after cleanup")
-                
-                # Adiciona as FKs
-                cursor.execute(f"""
-                ALTER TABLE {self.config.fato_deal_target}
-                ADD CONSTRAINT fk_owner FOREIGN KEY (owner_id) 
-                REFERENCES {self.config.dim_owners_target}(owner_id)
+                # Membros inferidos já foram criados na carga; a própria
+                # validação da FK acusa qualquer referência inválida restante
+                cursor.execute(compose("""
+                ALTER TABLE {fato}
+                ADD CONSTRAINT fk_owner FOREIGN KEY ({owner_key}) 
+                REFERENCES {dim_owners}({owner_key})
                 ON DELETE SET NULL;
                 
-                ALTER TABLE {self.config.fato_deal_target}
-                ADD CONSTRAINT fk_etapa FOREIGN KEY (etapa_id) 
-                REFERENCES {self.config.dim_etapa_target}(etapa_id)
+                ALTER TABLE {fato}
+                ADD CONSTRAINT fk_etapa FOREIGN KEY ({etapa_key}) 
+                REFERENCES {dim_etapa}({etapa_key})
                 ON DELETE SET NULL;
-                """)
+                """, fato=self.config.fato_deal_target,
+                    dim_owners=self.config.dim_owners_target,
+                    dim_etapa=self.config.dim_etapa_target,
+                    owner_key=owner_key, etapa_key=etapa_key))
                 
                 conn.commit()
                 logger.info("Foreign keys added successfully")
@@ -298,20 +714,141 @@ class Database:
             logger.error(f"Failed to add FKs: {e}")
             raise
 
+    def _dimension_keys(self):
+        """(dimensão, key map, chave natural, chave substituta) de cada dimensão"""
+        return [
+            (self.config.dim_etapa_target, self.config.dim_etapa_keymap, "etapa_id", "etapa_sk"),
+            (self.config.dim_owners_target, self.config.dim_owners_keymap, "owner_id", "owner_sk"),
+        ]
+
+    def _create_keymaps(self, cursor):
+        for _, keymap, key, sk in self._dimension_keys():
+            cursor.execute(compose("""
+            CREATE TABLE IF NOT EXISTS {keymap} (
+                {sk} INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                {key} TEXT NOT NULL UNIQUE
+            );""", keymap=keymap, key=key, sk=sk))
+
+    def sync_dimension_keys(self, conn):
+        """Atribui a cada membro das dimensões sua chave inteira estável.
+
+        O key map é persistente e só recebe inserções, então recargas e
+        reconstruções das dimensões mantêm os mesmos IDs.
+        """
+        try:
+            with conn.cursor() as cursor:
+                self._create_keymaps(cursor)
+                for dimension, keymap, key, sk in self._dimension_keys():
+                    cursor.execute(compose("""
+                    ALTER TABLE {dimension} ADD COLUMN IF NOT EXISTS {sk} INTEGER;
+                    CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {dimension} ({sk});
+
+                    INSERT INTO {keymap} ({key})
+                    SELECT {key} FROM {dimension}
+                    WHERE {key} IS NOT NULL
+                    ORDER BY {key}
+                    ON CONFLICT ({key}) DO NOTHING;
+
+                    UPDATE {dimension} d
+                    SET {sk} = k.{sk}
+                    FROM {keymap} k
+                    WHERE k.{key} = d.{key}
+                    AND d.{sk} IS DISTINCT FROM k.{sk};
+                    """, dimension=dimension, keymap=keymap, key=key, sk=sk,
+                        index=f"{dimension.split('.')[-1]}_{sk}_key"))
+                conn.commit()
+            logger.info("Chaves substitutas das dimensões sincronizadas")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Erro ao sincronizar chaves substitutas: {e}")
+            raise
+
+    def create_fact_view(self, conn):
+        """Recria a view que junta a fato publicada à tabela lateral de textos"""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(compose("""
+                CREATE OR REPLACE VIEW {view} AS
+                SELECT f.*, t.nome_negocio, t.detalhes
+                FROM {fato} f
+                LEFT JOIN {side} t ON t.deal_id = f.deal_id;
+                """, view=self.config.fato_deal_view, fato=self.config.fato_deal_target,
+                    side=self.config.fato_deal_text_table))
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Falha ao criar a view {self.config.fato_deal_view}: {e}")
+            raise
+
+    def _create_text_table(self, cursor, table_name):
+        """Tabela lateral com os textos longos, comprimidos e empurrados para o TOAST cedo"""
+        cursor.execute(compose("""
+        DROP TABLE IF EXISTS {side};
+        CREATE TABLE {side} (
+            deal_id TEXT,
+            nome_negocio TEXT,
+            detalhes TEXT
+        ) WITH (toast_tuple_target = 128);
+        ALTER TABLE {side}
+            ALTER COLUMN nome_negocio SET STORAGE EXTENDED,
+            ALTER COLUMN detalhes SET STORAGE EXTENDED;
+        """, side=table_name))
+        cursor.execute("SHOW server_version_num")
+        if int(cursor.fetchone()[0]) < 140000 or not self.config.FACT_TEXT_COMPRESSION:
+            return
+        set_compression = """
+        ALTER TABLE {side}
+            ALTER COLUMN nome_negocio SET COMPRESSION {method},
+            ALTER COLUMN detalhes SET COMPRESSION {method}
+        """
+        if self._text_compression is None:
+            # Servidor compilado sem o método (ex.: sem lz4): testa uma vez e cai para pglz
+            cursor.execute("SAVEPOINT text_compression")
+            try:
+                cursor.execute(compose(set_compression, side=table_name, method=self.config.FACT_TEXT_COMPRESSION))
+                cursor.execute("RELEASE SAVEPOINT text_compression")
+                self._text_compression = self.config.FACT_TEXT_COMPRESSION
+                return
+            except psycopg2.Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT text_compression")
+                logger.warning(f"Compressão {self.config.FACT_TEXT_COMPRESSION} indisponível, usando pglz: {e}")
+                self._text_compression = "pglz"
+        cursor.execute(compose(set_compression, side=table_name, method=self._text_compression))
+
+    def apply_fact_layout(self, conn):
+        """Ajustes opcionais de layout da fato publicada, antes das FKs"""
+        if self.config.SURROGATE_KEYS:
+            # A fato já sai da carga com as chaves inteiras; aqui só as dimensões recebem as suas
+            self.sync_dimension_keys(conn)
+        if self.config.FACT_SPLIT_TEXT:
+            # Depois da conversão de tipos: ALTER TYPE não roda com a view dependente
+            self.create_fact_view(conn)
+
+    def maintain_fact_tables(self, conn, run_id=None):
+        """Manutenção pós-carga da fato e das dimensões que a carga alterou, antes das FKs"""
+        from src.maintenance import extended_statistics, run_maintenance
+        tables = [self.config.fato_deal_target, self.config.dim_etapa_target, self.config.dim_owners_target]
+        if self.config.FACT_SPLIT_TEXT:
+            tables.insert(1, self.config.fato_deal_text_table)
+        return run_maintenance(
+            self, conn, tables, run_id,
+            statistics={self.config.fato_deal_target: extended_statistics(self.config)}
+        )
+
     def fix_invalid_owners(self, conn):
         """Fix invalid owners by setting to NULL"""
+        owner_key = self._reference_keys()[1]
         try:
             with conn.cursor() as cursor:
-                cursor.execute(f"""
-                UPDATE {self.config.fato_deal_target}
-                SET owner_id = NULL
-                WHERE owner_id IS NOT NULL
-                AND owner_id NOT IN (
-                    SELECT owner_id FROM {self.config.dim_owners_target}
-                );""")
+                cursor.execute(compose("""
+                UPDATE {fato} f
+                SET {key} = NULL
+                WHERE f.{key} IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM {dim_owners} d WHERE d.{key} = f.{key});""",
+                    fato=self.config.fato_deal_target, dim_owners=self.config.dim_owners_target, key=owner_key))
                 affected = cursor.rowcount
                 conn.commit()
-                logger.warning(f"Set {affected} invalid owner_ids to NULL")
+                logger.warning(f"Set {affected} invalid {owner_key}s to NULL")
             return True
         except Exception as e:
             conn.rollback()
@@ -320,17 +857,19 @@ class Database:
 
     def add_missing_owners(self, conn):
         """Add missing owners to dimension"""
+        if self.config.SURROGATE_KEYS:
+            # A fato só guarda owner_sk, não há owner_id de onde inferir o membro
+            logger.info("Surrogate keys enabled - missing owners come from the fact load")
+            return True
         try:
             with conn.cursor() as cursor:
-                cursor.execute(f"""
-                INSERT INTO {self.config.dim_owners_target} (owner_id, owner_name)
+                cursor.execute(compose("""
+                INSERT INTO {dim_owners} (owner_id, owner_name)
                 SELECT DISTINCT f.owner_id, 'DESCONHECIDO'
-                FROM {self.config.fato_deal_target} f
+                FROM {fato} f
                 WHERE f.owner_id IS NOT NULL
-                AND f.owner_id NOT IN (
-                    SELECT owner_id FROM {self.config.dim_owners_target}
-                )
-                ON CONFLICT (owner_id) DO NOTHING;""")
+                AND NOT EXISTS (SELECT 1 FROM {dim_owners} d WHERE d.owner_id = f.owner_id)
+                ON CONFLICT (owner_id) DO NOTHING;""", fato=self.config.fato_deal_target, dim_owners=self.config.dim_owners_target))
                 added = cursor.rowcount
                 conn.commit()
                 logger.info(f"Added {added} missing owners to dimension")
@@ -344,18 +883,105 @@ class Database:
         """Clean up temporary table"""
         try:
             with conn.cursor() as cursor:
-                cursor.execute(f"DROP TABLE IF EXISTS {self.config.fato_deal_target}_temp")
+                cursor.execute(compose(
+                    "DROP TABLE IF EXISTS {staging}; DROP TABLE IF EXISTS {text_staging}",
+                    staging=self.config.fato_deal_staging, text_staging=self.config.fato_deal_text_staging
+                ))
                 conn.commit()
             logger.info("Temporary table cleaned up")
         except Exception as e:
             logger.error(f"Error cleaning up temp table: {e}")
             raise
 
+    def publish_fato_table(self, conn):
+        """Substitui a tabela fato publicada pela tabela de staging já validada.
+
+        Os membros inferidos das dimensões entram na mesma transação, então
+        uma carga barrada pelo perfil não altera as dimensões publicadas.
+        """
+        try:
+            target_name = self.config.fato_deal_target.split('.')[-1]
+            with conn.cursor() as cursor:
+                self.insert_inferred_members(cursor)
+                cursor.execute(compose("DROP TABLE IF EXISTS {fato} CASCADE", fato=self.config.fato_deal_target))
+                cursor.execute(compose(
+                    "ALTER TABLE {staging} RENAME TO {name}",
+                    staging=self.config.fato_deal_staging, name=target_name
+                ))
+                if self.config.SURROGATE_KEYS:
+                    # Só catálogo; o espaço volta na reescrita de safe_convert_data_types
+                    cursor.execute(compose(
+                        "ALTER TABLE {fato} DROP COLUMN etapa_id, DROP COLUMN owner_id",
+                        fato=self.config.fato_deal_target
+                    ))
+                if self.config.FACT_SPLIT_TEXT:
+                    side = self.config.fato_deal_text_table
+                    cursor.execute(compose("""
+                    DROP TABLE IF EXISTS {side} CASCADE;
+                    ALTER TABLE {text_staging} RENAME TO {name};
+                    CREATE INDEX IF NOT EXISTS {index} ON {side} (deal_id);
+                    """, side=side, text_staging=self.config.fato_deal_text_staging,
+                        name=side.split('.')[-1], index=f"{side.split('.')[-1]}_deal_id_idx"))
+                conn.commit()
+            logger.info(f"Tabela {self.config.fato_deal_target} publicada a partir do staging")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Falha ao publicar tabela fato: {e}")
+            raise
+
+    def load_fact_staged(self, conn, run_id=None):
+        """Carrega a fato em staging, perfila numa única passada e só então publica"""
+        from src.etl import build_fato_deal_query
+        from src.quality import profile_fato_deal, check_profile, new_run_id
+
+        run_id = run_id or new_run_id()
+
+        self.heartbeat(conn)
+        self.create_fato_deal_table(conn, self.config.fato_deal_staging)
+        self.load_fato_deal_rows(
+            conn, self.config.fato_deal_staging, build_fato_deal_query(self.config, raw=True)
+        )
+        self.heartbeat(conn)
+
+        if self.config.DQ_ENABLED:
+            text_table = self.config.fato_deal_text_staging if self.config.FACT_SPLIT_TEXT else None
+            profile = profile_fato_deal(self, conn, self.config.fato_deal_staging, run_id, text_table)
+            self.heartbeat(conn)
+            try:
+                check_profile(profile, run_id)
+            except Exception:
+                self.cleanup_temp_table(conn)
+                raise
+
+        self.publish_fato_table(conn)
+
+    def get_table_fingerprints(self, conn, table_names):
+        """Retorna um fingerprint barato (oid + contadores de pg_stat_user_tables) por tabela.
+
+        O oid entra para que uma tabela recriada com o mesmo volume não pareça inalterada.
+        Tabelas sem estatísticas ficam com None, o que o agendador trata como alteração.
+        """
+        names = [t if '.' in t else f"public.{t}" for t in table_names]
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                SELECT schemaname || '.' || relname, relid::BIGINT, n_tup_ins, n_tup_upd, n_tup_del
+                FROM pg_stat_user_tables
+                WHERE schemaname || '.' || relname = ANY(%s)
+                """, (names,))
+                found = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+            conn.commit()
+            return {name: found.get(name) for name in names}
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Erro ao obter fingerprints: {e}")
+            raise
+
     def check_table_has_data(self, conn, table_name):
         """Verifica se a tabela contém dados"""
         try:
             with conn.cursor() as cursor:
-                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table_name} LIMIT 1)")
+                self._execute_prepared(cursor, compose("SELECT EXISTS (SELECT 1 FROM {table} LIMIT 1)", table=table_name))
                 return cursor.fetchone()[0]
         except Exception as e:
             logger.error(f"Erro ao verificar dados em {table_name}: {e}")
@@ -366,53 +992,54 @@ class Database:
         try:
             table_name = target_table.split('.')[-1]  # Remove o schema do nome
             temp_table = f"temp_{table_name}"
+            source_query = self.extract_source(conn, source_query)
             
             with conn.cursor() as cursor:
                 # Cria tabela temporária
-                cursor.execute(f"CREATE TEMP TABLE {temp_table} AS {source_query}")
+                cursor.execute(compose("CREATE TEMP TABLE {temp} AS ", temp=temp_table) + as_sql(source_query))
                 
                 # Determina a estratégia de update baseada no nome da tabela
-                if "dim_etapa" in target_table:
+                if target_table == self.config.dim_etapa_target:
                     # Atualização para dim_etapa
-                    cursor.execute(f"""
-                    UPDATE {target_table} t
+                    self._execute_prepared(cursor, compose("""
+                    UPDATE {target} t
                     SET 
                         pipeline = s.pipeline,
                         etapa = s.etapa
-                    FROM {temp_table} s
+                    FROM {temp} s
                     WHERE t.etapa_id = s.etapa_id
-                    """)
+                    """, target=target_table, temp=temp_table))
                     
                     # Insere novos registros para dim_etapa
-                    cursor.execute(f"""
-                    INSERT INTO {target_table} (etapa_id, pipeline, etapa)
+                    self._execute_prepared(cursor, compose("""
+                    INSERT INTO {target} (etapa_id, pipeline, etapa)
                     SELECT s.etapa_id, s.pipeline, s.etapa
-                    FROM {temp_table} s
-                    LEFT JOIN {target_table} t ON s.etapa_id = t.etapa_id
+                    FROM {temp} s
+                    LEFT JOIN {target} t ON s.etapa_id = t.etapa_id
                     WHERE t.etapa_id IS NULL
-                    """)
+                    """, target=target_table, temp=temp_table))
                     
-                elif "dim_owners" in target_table:
+                elif target_table == self.config.dim_owners_target:
                     # Atualização para dim_owners
-                    cursor.execute(f"""
-                    UPDATE {target_table} t
+                    self._execute_prepared(cursor, compose("""
+                    UPDATE {target} t
                     SET 
                         owner_name = s.owner_name
-                    FROM {temp_table} s
+                    FROM {temp} s
                     WHERE t.owner_id = s.owner_id
-                    """)
+                    """, target=target_table, temp=temp_table))
                     
                     # Insere novos registros para dim_owners
-                    cursor.execute(f"""
-                    INSERT INTO {target_table} (owner_id, owner_name)
+                    self._execute_prepared(cursor, compose("""
+                    INSERT INTO {target} (owner_id, owner_name)
                     SELECT s.owner_id, s.owner_name
-                    FROM {temp_table} s
-                    LEFT JOIN {target_table} t ON s.owner_id = t.owner_id
+                    FROM {temp} s
+                    LEFT JOIN {target} t ON s.owner_id = t.owner_id
                     WHERE t.owner_id IS NULL
-                    """)
+                    """, target=target_table, temp=temp_table))
                 
                 # Limpa a tabela temporária
-                cursor.execute(f"DROP TABLE IF EXISTS {temp_table}")
+                cursor.execute(compose("DROP TABLE IF EXISTS {temp}", temp=temp_table))
                 
                 conn.commit()
             logger.info(f"Dados atualizados em {target_table}")
@@ -432,11 +1059,13 @@ class Database:
         
         # Create initial table
         self.create_fato_deal_table(conn)
-        self.truncate_and_insert(conn, self.config.fato_deal_target, build_fato_deal_query(self.config))
+        self.load_fato_deal_rows(conn, self.config.fato_deal_target, build_fato_deal_query(self.config))
         
         # Convert data types
         try:
             self.safe_convert_data_types(conn)
+            self.apply_fact_layout(conn)
+            self.maintain_fact_tables(conn)
             try:
                 self.add_foreign_keys(conn)
             except Exception as fk_error:
@@ -444,8 +1073,23 @@ class Database:
         except Exception as conv_error:
             logger.error(f"Type conversion failed: {conv_error}")
 
-    def process_fact_with_fallback(self):
+    def process_fact_with_fallback(self, run_id=None):
+        """Processa a tabela fato sob lease, reaproveitando uma reconstrução concorrente.
+
+        Retorna True quando reaproveitou a reconstrução de outro processo.
+        """
+        from src.lease import table_lease
+        with table_lease(self, self.config.fato_deal_target) as lease:
+            if lease.reused:
+                return True
+            self._process_fact_with_fallback(run_id)
+            lease.complete()
+        return False
+
+    def _process_fact_with_fallback(self, run_id=None):
         """Processa a tabela fato com fallback caso as FKs falhem"""
+        from src.quality import DataQualityError, new_run_id
+        run_id = run_id or new_run_id()
         try:
             with self.get_connection() as conn:
                 # Verifica se as dimensões existem
@@ -453,17 +1097,17 @@ class Database:
                 not self.check_table_exists(conn, self.config.dim_owners_target):
                     raise Exception("Dimension tables not found. Load them first.")
                 
-                # Cria tabela inicial
-                self.create_fato_deal_table(conn)
-                
-                # Importa a função aqui para evitar circular imports
-                from src.etl import build_fato_deal_query
-                self.truncate_and_insert(conn, self.config.fato_deal_target, build_fato_deal_query(self.config))
+                # Carga em staging + perfil de qualidade antes de publicar
+                self.load_fact_staged(conn, run_id)
                 
                 # Conversão de tipos
+                self.heartbeat(conn)
                 self.safe_convert_data_types(conn)
-                self.fix_invalid_references(conn)
-                self.add_foreign_keys(conn)
+                self.heartbeat(conn)
+                self.apply_fact_layout(conn)
+                self.heartbeat(conn)
+                self.maintain_fact_tables(conn, run_id)
+                self.heartbeat(conn)
 
                 # Tenta adicionar FKs
                 try:
@@ -471,77 +1115,71 @@ class Database:
                 except Exception as fk_error:
                     logger.warning(f"FK constraints not added: {fk_error}")
                     
+        except DataQualityError as e:
+            logger.error(f"Publicação bloqueada pelo perfil de qualidade: {e}")
+            raise
         except Exception as e:
             logger.error(f"Fact processing failed: {e}")
             logger.info("Attempting fallback processing without FKs...")
+            # Novo run_id: o perfil da nova carga não pode duplicar o da tentativa anterior
+            fallback_run_id = new_run_id()
+            logger.info(f"Fallback run {fallback_run_id} (original {run_id})")
             with self.get_connection() as conn:
-                self.create_fato_deal_table(conn)
-                from src.etl import build_fato_deal_query
-                self.truncate_and_insert(conn, self.config.fato_deal_target, build_fato_deal_query(self.config))
+                self.load_fact_staged(conn, fallback_run_id)
+                self.heartbeat(conn)
                 self.safe_convert_data_types(conn)
+                self.heartbeat(conn)
+                self.apply_fact_layout(conn)
+                self.heartbeat(conn)
+                self.maintain_fact_tables(conn, fallback_run_id)
 
     def log_invalid_references(self, conn):
         """Log details about invalid references between fact and dimensions"""
+        etapa_key, owner_key = self._reference_keys()
         with conn.cursor() as cursor:
             # Check invalid etapa references
-            cursor.execute(f"""
-            SELECT f.etapa_id, COUNT(*) as invalid_count
-            FROM {self.config.fato_deal_target} f
-            WHERE f.etapa_id IS NOT NULL 
-            AND f.etapa_id NOT IN (
-                SELECT etapa_id FROM {self.config.dim_etapa_target}
-            )
-            GROUP BY f.etapa_id
+            cursor.execute(compose("""
+            SELECT f.{key}, COUNT(*) as invalid_count
+            FROM {fato} f
+            WHERE f.{key} IS NOT NULL 
+            AND NOT EXISTS (SELECT 1 FROM {dim_etapa} d WHERE d.{key} = f.{key})
+            GROUP BY f.{key}
             ORDER BY invalid_count DESC
             LIMIT 10;
-            """)
+            """, fato=self.config.fato_deal_target, dim_etapa=self.config.dim_etapa_target, key=etapa_key))
             invalid_etapas = cursor.fetchall()
             
             if invalid_etapas:
                 logger.warning("Top invalid etapa references:")
-                for etapa_id, count in invalid_etapas:
-                    logger.warning(f"etapa_id: {etapa_id} - {count} records")
+                for etapa, count in invalid_etapas:
+                    logger.warning(f"{etapa_key}: {etapa} - {count} records")
 
             # Check invalid owner references
-            cursor.execute(f"""
-            SELECT f.owner_id, COUNT(*) as invalid_count
-            FROM {self.config.fato_deal_target} f
-            WHERE f.owner_id IS NOT NULL 
-            AND f.owner_id NOT IN (
-                SELECT owner_id FROM {self.config.dim_owners_target}
-            )
-            GROUP BY f.owner_id
+            cursor.execute(compose("""
+            SELECT f.{key}, COUNT(*) as invalid_count
+            FROM {fato} f
+            WHERE f.{key} IS NOT NULL 
+            AND NOT EXISTS (SELECT 1 FROM {dim_owners} d WHERE d.{key} = f.{key})
+            GROUP BY f.{key}
             ORDER BY invalid_count DESC
             LIMIT 10;
-            """)
+            """, fato=self.config.fato_deal_target, dim_owners=self.config.dim_owners_target, key=owner_key))
             invalid_owners = cursor.fetchall()
             
             if invalid_owners:
                 logger.warning("Top invalid owner references:")
-                for owner_id, count in invalid_owners:
-                    logger.warning(f"owner_id: {owner_id} - {count} records")
+                for owner, count in invalid_owners:
+                    logger.warning(f"{owner_key}: {owner} - {count} records")
 
     def validate_data_consistency(self, conn):
         """Valida a consistência dos dados nas tabelas relacionadas"""
         try:
             with conn.cursor() as cursor:
                 # Verifica referências inválidas
-                cursor.execute(f"""
-                SELECT COUNT(*) FROM {self.config.fato_deal_target}
-                WHERE etapa_id IS NOT NULL 
-                AND etapa_id NOT IN (
-                    SELECT etapa_id FROM {self.config.dim_etapa_target}
-                )
-                """)
+                self._execute_prepared(cursor, self._invalid_etapas_count())
                 invalid_etapas = cursor.fetchone()[0]
                 
-                cursor.execute(f"""
-                SELECT COUNT(*) FROM {self.config.fato_deal_target}
-                WHERE owner_id IS NOT NULL 
-                AND owner_id NOT IN (
-                    SELECT owner_id FROM {self.config.dim_owners_target}
-                )
-                """)
+                self._execute_prepared(cursor, self._invalid_owners_count())
                 invalid_owners = cursor.fetchone()[0]
                 
                 if invalid_etapas > 0 or invalid_owners > 0:
@@ -552,49 +1190,3 @@ class Database:
         except Exception as e:
             logger.error(f"Error validating data consistency: {e}")
             raise
-
-    def fix_invalid_references(self, conn):
-        """Corrige referências inválidas antes de aplicar FKs"""
-        try:
-            with conn.cursor() as cursor:
-                # 1. Adiciona etapas faltantes à dimensão
-                cursor.execute(f"""
-                INSERT INTO {self.config.dim_etapa_target} (etapa_id, pipeline, etapa)
-                SELECT DISTINCT f.etapa_id, 'DESCONHECIDO', 'DESCONHECIDO'
-                FROM {self.config.fato_deal_target} f
-                WHERE f.etapa_id IS NOT NULL
-                AND f.etapa_id NOT IN (
-                    SELECT etapa_id FROM {self.config.dim_etapa_target}
-                )
-                ON CONFLICT (etapa_id) DO NOTHING;
-                """)
-                
-                # 2. Adiciona owners faltantes à dimensão
-                cursor.execute(f"""
-                INSERT INTO {self.config.dim_owners_target} (owner_id, owner_name)
-                SELECT DISTINCT f.owner_id, 'DESCONHECIDO'
-                FROM {self.config.fato_deal_target} f
-                WHERE f.owner_id IS NOT NULL
-                AND f.owner_id NOT IN (
-                    SELECT owner_id FROM {self.config.dim_owners_target}
-                )
-                ON CONFLICT (owner_id) DO NOTHING;
-                """)
-                
-                # 3. Remove referências completamente inválidas (se necessário)
-                cursor.execute(f"""
-                UPDATE {self.config.fato_deal_target}
-                SET etapa_id = NULL
-                WHERE etapa_id IS NOT NULL
-                AND etapa_id NOT IN (
-                    SELECT etapa_id FROM {self.config.dim_etapa_target}
-                );
-                """)
-                
-                conn.commit()
-                logger.info("Invalid references fixed successfully")
-                
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error fixing references: {e}")
-            raise
\ No newline at end of file
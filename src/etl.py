@@ -1,33 +1,38 @@
 # src/etl.py
+import sys
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from psycopg2 import sql
 from src.database import Database
 from src.logger import logger
 from src.config import Config
+from src.lease import REUSED_EXIT_CODE, run_outcome, table_lease
+from src.maintenance import run_maintenance
+from src.quality import valid_date
+from src.relay import relay_process
+from src.sql import compose, ident
+
+project_root = Path(__file__).parent.parent
 
 def build_dim_etapa_query(config):
-    return f"SELECT etapa_id, pipeline, etapa FROM {config.dim_etapa_source}"
+    return compose("SELECT etapa_id, pipeline, etapa FROM {source}", source=config.dim_etapa_source)
 
 def build_dim_owners_query(config):
-    return f"SELECT owner_id, owner_name FROM {config.dim_owners_source}"
+    return compose("SELECT owner_id, owner_name FROM {source}", source=config.dim_owners_source)
+
+def build_fato_deal_query(config, raw=False):
+    """Garante o formato DATE para campos de data.
 
-def build_fato_deal_query(config):
-    """Garante o formato DATE para campos de data"""
-    return f"""
+    Com raw=True as datas seguem sem filtro para que o perfil de qualidade
+    consiga contar as inválidas.
+    """
+    if raw:
+        return compose("""
     SELECT 
         deal_id, 
-        -- Garante o formato DATE para PostgreSQL
-        CASE
-            WHEN data_negocio_criado ~ '^\d{{4}}-\d{{2}}-\d{{2}}$' 
-                THEN data_negocio_criado
-            ELSE NULL
-        END AS data_negocio_criado,
-        
-        CASE
-            WHEN data_agendamento ~ '^\d{{4}}-\d{{2}}-\d{{2}}$' 
-                THEN data_agendamento
-            ELSE NULL
-        END AS data_agendamento,
-        
+        data_negocio_criado,
+        data_agendamento,
         nome_negocio,
         etapa_id,
         valor::TEXT,
@@ -36,33 +41,44 @@ def build_fato_deal_query(config):
         canal,
         detalhes,
         owner_id
-    FROM {config.fato_deal_source}
-    """
+    FROM {source}
+    """, source=config.fato_deal_source)
+    return _fato_deal_query(config.fato_deal_source)
+
+@lru_cache(maxsize=None)
+def _fato_deal_query(source):
+    return sql.SQL("""
+    SELECT 
+        deal_id, 
+        -- Garante o formato DATE para PostgreSQL (inválidas viram NULL)
+        {data_negocio_criado} AS data_negocio_criado,
+        {data_agendamento} AS data_agendamento,
+        nome_negocio,
+        etapa_id,
+        valor::TEXT,
+        funil,
+        origem,
+        canal,
+        detalhes,
+        owner_id
+    FROM {source}
+    """).format(
+        source=ident(source),
+        data_negocio_criado=valid_date("data_negocio_criado"),
+        data_agendamento=valid_date("data_agendamento"),
+    )
 
 def run_etl_process():
     try:
-        process = subprocess.Popen(
+        result = relay_process(
             [sys.executable, "-m", "src.etl", "dim_etapa"],
-            cwd=project_root,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
+            "dim_etapa",
+            cwd=project_root
         )
 
-        # Captura logs em tempo real
-        while process.poll() is None:
-            output = process.stdout.readline()
-            error = process.stderr.readline()
-            
-            if output:
-                logger.info(f"[DIM_ETAPA] {output.strip()}")
-            if error:
-                logger.error(f"[DIM_ETAPA] {error.strip()}")
-
         # Verifica se houve erro real ou apenas aviso
-        if process.returncode != 0:
+        if not run_outcome(result.returncode):
+            error = "\n".join(result.stderr_tail)
             # Verifica se foi apenas um aviso de tabela existente
             if "already exists" in error or "já existe" in error:
                 logger.warning("Tabela já existente - processo continuou")
@@ -90,36 +106,63 @@ def process_dimension(db, table_type):
         
         db.truncate_and_insert(conn, target, query)
 def process_dimension(db, table_type):
-    """Processa tabelas de dimensão com tratamento de erros"""
+    """Processa tabelas de dimensão com tratamento de erros.
+
+    Retorna True quando reaproveitou a reconstrução de outro processo.
+    """
     try:
         logger.info(f"Processando {table_type}")
-        with db.get_connection() as conn:
-            if table_type == "dim_etapa":
-                db.create_dim_etapa_table(conn)  # Agora é idempotente
-                query = build_dim_etapa_query(db.config)
-                target = db.config.dim_etapa_target
-            else:
-                db.create_dim_owners_table(conn)
-                query = build_dim_owners_query(db.config)
-                target = db.config.dim_owners_target
-            
-            # Verifica se a tabela tem dados antes de truncar
-            if db.check_table_has_data(conn, target):
-                logger.info(f"Dados existentes em {target} serão preservados")
-                insert_method = db.insert_update_data
-            else:
-                logger.info(f"Tabela {target} vazia, carregando dados novos")
-                insert_method = db.truncate_and_insert
-            
-            insert_method(conn, target, query)
+        with table_lease(db, getattr(db.config, f"{table_type}_target")) as lease:
+            if lease.reused:
+                return True
+            _load_dimension(db, table_type)
+            lease.complete()
+        return False
             
     except Exception as e:
         logger.error(f"Falha ao processar {table_type}: {str(e)}")
         raise
 
+def _load_dimension(db, table_type):
+    """Carrega a dimensão (merge se já houver dados, carga completa se vazia)"""
+    with db.get_connection() as conn:
+        if table_type == "dim_etapa":
+            db.create_dim_etapa_table(conn)  # Agora é idempotente
+            query = build_dim_etapa_query(db.config)
+            target = db.config.dim_etapa_target
+        else:
+            db.create_dim_owners_table(conn)
+            query = build_dim_owners_query(db.config)
+            target = db.config.dim_owners_target
+        
+        # Verifica se a tabela tem dados antes de truncar
+        if db.check_table_has_data(conn, target):
+            logger.info(f"Dados existentes em {target} serão preservados")
+            insert_method = db.insert_update_data
+        else:
+            logger.info(f"Tabela {target} vazia, carregando dados novos")
+            insert_method = db.truncate_and_insert
+        
+        db.heartbeat(conn)
+        insert_method(conn, target, query)
+        db.heartbeat(conn)
+        run_maintenance(db, conn, [target])
+
 def process_fact(db):
-    """Process fact table with dependencies"""
+    """Process fact table under a lease, reusing a concurrent rebuild.
+
+    Returns True when another process's rebuild was reused.
+    """
     logger.info("Processing fact table")
+    with table_lease(db, db.config.fato_deal_target) as lease:
+        if lease.reused:
+            return True
+        _load_fact(db)
+        lease.complete()
+    return False
+
+def _load_fact(db):
+    """Load fact table with dependencies"""
     with db.get_connection() as conn:
         # Verify dimensions exist and have data
         if not db.check_table_exists(conn, db.config.dim_etapa_target) or \
@@ -131,13 +174,18 @@ def process_fact(db):
            not db.check_table_has_data(conn, db.config.dim_owners_target):
             logger.warning("Dimension tables are empty. Loading fact data anyway but FKs may fail.")
         
-        # Create initial table
-        db.create_fato_deal_table(conn)
-        db.truncate_and_insert(conn, db.config.fato_deal_target, build_fato_deal_query(db.config))
+        # Carga em staging + perfil de qualidade antes de publicar
+        db.load_fact_staged(conn)
         
         # Convert data types
         try:
+            db.heartbeat(conn)
             db.safe_convert_data_types(conn)
+            db.heartbeat(conn)
+            db.apply_fact_layout(conn)
+            db.heartbeat(conn)
+            db.maintain_fact_tables(conn)
+            db.heartbeat(conn)
             
             # Try to add foreign keys with cleanup for invalid references
             try:
@@ -157,7 +205,7 @@ def process_fact(db):
             logger.error(f"Type conversion failed: {conv_error}")
 
 def main(table_type):
-    """Main ETL entry point"""
+    """Main ETL entry point; returns True when a concurrent rebuild was reused"""
     logger.info(f"Starting ETL for {table_type}")
     start = datetime.now()
     
@@ -177,12 +225,14 @@ def main(table_type):
                 db.create_schema(conn, db.config.TARGET_SCHEMA)
         
         # Process the requested table
+        reused = False
         if table_type in ["dim_etapa", "dim_owners"]:
-            process_dimension(db, table_type)
+            reused = process_dimension(db, table_type)
         elif table_type == "fato_deal":
-            process_fact(db)
+            reused = process_fact(db)
         
         logger.info(f"ETL completed in {datetime.now() - start}")
+        return reused
     except Exception as e:
         logger.error(f"ETL failed: {str(e)}")
         raise
@@ -190,6 +240,7 @@ def main(table_type):
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
-        main(sys.argv[1])
+        # Código próprio para o chamador não gravar checkpoint com o próprio snapshot
+        sys.exit(REUSED_EXIT_CODE if main(sys.argv[1]) else 0)
     else:
         print("Usage: python -m src.etl [dim_etapa|dim_owners|fato_deal]")
\ No newline at end of file
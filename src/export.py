@@ -0,0 +1,266 @@
+# src/export.py
+import os
+import sys
+import json
+import gzip
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
+from src.database import Database
+from src.logger import logger
+from src.sql import compose
+
+CSV_EXTENSIONS = {"gzip": ".csv.gz", "zstd": ".csv.zst", "none": ".csv"}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Exportação Parquet requer o pacote pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _open_compressed(raw, compression):
+    """Envolve o arquivo de saída no compressor de streaming escolhido"""
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="wb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError("Compressão zstd requer o pacote zstandard") from e
+        return zstandard.ZstdCompressor().stream_writer(raw)
+    return raw
+
+
+def _sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _leaf_relations(conn, table_name):
+    """Partições folha de uma tabela particionada, ou a própria tabela"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", (table_name,))
+        if cursor.fetchone()[0] != 'p':
+            return [table_name]
+        cursor.execute("""
+        SELECT n.nspname || '.' || c.relname
+        FROM pg_partition_tree(%s::regclass) t
+        JOIN pg_class c ON c.oid = t.relid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE t.isleaf
+        ORDER BY 1
+        """, (table_name,))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _arrow_field(pa, column):
+    """Mapeia o tipo PostgreSQL (OID) para um campo Arrow e um conversor de valores"""
+    oid = column.type_code
+    if oid == 16:
+        return pa.field(column.name, pa.bool_()), None
+    if oid in (20, 21, 23):
+        return pa.field(column.name, {20: pa.int64(), 21: pa.int16(), 23: pa.int32()}[oid]), None
+    if oid in (700, 701):
+        return pa.field(column.name, pa.float64()), None
+    if oid == 1700:
+        if column.precision and column.precision <= 38:
+            return pa.field(column.name, pa.decimal128(column.precision, column.scale or 0)), None
+        return pa.field(column.name, pa.float64()), float
+    if oid == 1082:
+        return pa.field(column.name, pa.date32()), None
+    if oid == 1114:
+        return pa.field(column.name, pa.timestamp("us")), None
+    if oid == 1184:
+        return pa.field(column.name, pa.timestamp("us", tz="UTC")), None
+    return pa.field(column.name, pa.string()), str
+
+
+def _write_parquet(db, conn, relation, path, compression):
+    pa, pq = _require_pyarrow()
+    batch_size = db.config.EXPORT_BATCH_SIZE
+    rows_written = 0
+
+    with conn.cursor() as cursor:
+        cursor.execute(compose("SELECT * FROM {relation} LIMIT 0", relation=relation))
+        fields = [_arrow_field(pa, column) for column in cursor.description]
+
+    schema = pa.schema([field for field, _ in fields])
+    writer = pq.ParquetWriter(str(path), schema, compression=compression)
+    try:
+        batches = db.stream_query(
+            conn, compose("SELECT * FROM {relation}", relation=relation),
+            itersize=batch_size, batch_format="rows"
+        )
+        for rows in batches:
+            arrays = []
+            for (field, convert), values in zip(fields, zip(*rows)):
+                if convert:
+                    values = [None if v is None else convert(v) for v in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=batch_size)
+            rows_written += len(rows)
+    finally:
+        writer.close()
+
+    return rows_written, [field.name for field, _ in fields]
+
+
+def _write_csv(conn, relation, path, compression):
+    with conn.cursor() as cursor:
+        cursor.execute(compose("SELECT * FROM {relation} LIMIT 0", relation=relation))
+        columns = [desc[0] for desc in cursor.description]
+
+        with open(path, "wb") as raw:
+            out = _open_compressed(raw, compression)
+            copy = compose("COPY {relation} TO STDOUT WITH (FORMAT csv, HEADER true)", relation=relation)
+            cursor.copy_expert(copy.as_string(cursor), out)
+            rows_written = cursor.rowcount
+            if out is not raw:
+                out.close()
+
+    return rows_written, columns
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _export_relations(db, table_name, relations, fingerprints, target_dir, fmt, compression, force):
+    """Grava em arquivos .tmp as relações alteradas, numa única transação de leitura.
+
+    Retorna (relação, fingerprint, arquivo, manifesto, .tmp, linhas, colunas) de cada uma.
+    """
+    exported = []
+    with db.get_read_connection() as conn:
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+
+        for relation in relations:
+            extension = ".parquet" if fmt == "parquet" else CSV_EXTENSIONS[compression]
+            data_path = target_dir / f"{relation}{extension}"
+            manifest_path = target_dir / f"{relation}{extension}.manifest.json"
+            fingerprint = fingerprints.get(relation)
+            fingerprint = list(fingerprint) if fingerprint else None
+
+            previous = _read_manifest(manifest_path)
+            if not force and previous and data_path.exists() and fingerprint \
+                    and previous.get("fingerprint") == fingerprint:
+                logger.info(f"⏭ {relation} inalterada desde a última exportação")
+                continue
+
+            tmp_path = data_path.with_name(data_path.name + ".tmp")
+            if fmt == "parquet":
+                rows, columns = _write_parquet(db, conn, relation, tmp_path, compression)
+            else:
+                rows, columns = _write_csv(conn, relation, tmp_path, compression)
+            exported.append((relation, fingerprint, data_path, manifest_path, tmp_path, rows, columns))
+
+        conn.commit()
+    return exported
+
+
+def export_table(db, table_name, output_dir, fmt=None, compression=None, force=False):
+    """Exporta uma tabela (ou cada partição alterada) em streaming para arquivos locais.
+
+    Cada arquivo ganha um <arquivo>.manifest.json com linhas, bytes, sha256 e o
+    fingerprint da origem; partições cujo fingerprint não mudou são puladas.
+    Os fingerprints são relidos depois da leitura: se a origem mudou no meio, a
+    exportação é refeita; esgotadas as tentativas, o manifesto sai sem fingerprint
+    e a próxima exportação refaz o arquivo.
+    """
+    fmt = fmt or db.config.EXPORT_FORMAT
+    compression = compression or db.config.EXPORT_COMPRESSION
+    if fmt == "csv" and compression not in CSV_EXTENSIONS:
+        raise ValueError(f"Compressão {compression} não suportada para CSV")
+    target_dir = Path(output_dir) / table_name
+    target_dir.mkdir(parents=True, exist_ok=True)
+    attempts = max(db.config.EXPORT_CONSISTENCY_ATTEMPTS, 1)
+
+    for attempt in range(1, attempts + 1):
+        # Fingerprints vêm do primário (os contadores de pg_stat_user_tables não são replicados)
+        with db.get_connection() as conn:
+            relations = _leaf_relations(conn, table_name)
+            fingerprints = db.get_table_fingerprints(conn, relations)
+
+        exported = _export_relations(db, table_name, relations, fingerprints, target_dir, fmt, compression, force)
+
+        with db.get_connection() as conn:
+            current = db.get_table_fingerprints(conn, [item[0] for item in exported])
+        changed = [item[0] for item in exported if current.get(item[0]) != fingerprints.get(item[0])]
+        if not changed:
+            break
+        if attempt < attempts:
+            logger.warning(f"{', '.join(changed)} mudou durante a exportação, refazendo ({attempt}/{attempts})")
+            for item in exported:
+                item[4].unlink(missing_ok=True)
+            continue
+        logger.warning(f"{', '.join(changed)} seguiu mudando; manifesto gravado sem fingerprint")
+
+    manifests = []
+    for relation, fingerprint, data_path, manifest_path, tmp_path, rows, columns in exported:
+        os.replace(tmp_path, data_path)
+        manifest = {
+            "table": table_name,
+            "relation": relation,
+            "file": data_path.name,
+            "format": fmt,
+            "compression": compression,
+            "rows": rows,
+            "bytes": data_path.stat().st_size,
+            "sha256": _sha256(data_path),
+            "columns": columns,
+            "fingerprint": None if relation in changed else fingerprint,
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        manifests.append(manifest)
+        logger.info(f"📦 {relation} exportada: {rows} linhas em {data_path}")
+    return manifests
+
+
+def export_trusted_tables(db, output_dir=None, fmt=None, compression=None, force=False):
+    """Exporta as tabelas trusted (dimensões e fato, mais a tabela lateral de textos quando separada)"""
+    output_dir = output_dir or db.config.EXPORT_DIR
+    tables = [db.config.dim_etapa_target, db.config.dim_owners_target, db.config.fato_deal_target]
+    if db.config.FACT_SPLIT_TEXT:
+        tables.append(db.config.fato_deal_text_table)
+    manifests = []
+    for table_name in tables:
+        manifests.extend(export_table(db, table_name, output_dir, fmt, compression, force))
+    return manifests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta tabelas trusted para Parquet/CSV")
+    parser.add_argument("tables", nargs="*", help="Tabelas (schema.tabela); padrão: todas as trusted")
+    parser.add_argument("--output-dir")
+    parser.add_argument("--format", choices=["parquet", "csv"])
+    parser.add_argument("--compression", choices=["zstd", "gzip", "snappy", "none"])
+    parser.add_argument("--force", action="store_true", help="Reexporta mesmo sem alterações")
+    args = parser.parse_args(argv)
+
+    db = Database()
+    if args.tables:
+        output_dir = args.output_dir or db.config.EXPORT_DIR
+        for table_name in args.tables:
+            export_table(db, table_name, output_dir, args.format, args.compression, args.force)
+    else:
+        export_trusted_tables(db, args.output_dir, args.format, args.compression, args.force)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
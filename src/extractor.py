@@ -0,0 +1,392 @@
+# src/extractor.py
+import io
+import sys
+import csv
+import json
+import time
+import queue
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from psycopg2 import sql
+from src.database import Database
+from src.ingest import LANDING_COLUMNS, create_landing_table, landing_table
+from src.logger import logger
+from src.sql import compose, ident, columns as column_list
+
+RETRYABLE_ERRORS = (urllib.error.URLError, TimeoutError, ConnectionError)
+
+
+class ExtractError(Exception):
+    """Raised when the HubSpot API keeps failing after all retries"""
+
+
+class TokenBucket:
+    """Limitador token bucket ajustado pelos cabeçalhos X-HubSpot-RateLimit-*"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update(self, headers):
+        """Segue o limite anunciado pela API e nunca assume mais saldo do que o restante"""
+        try:
+            limit = int(headers.get("X-HubSpot-RateLimit-Max"))
+            remaining = int(headers.get("X-HubSpot-RateLimit-Remaining"))
+            interval = int(headers.get("X-HubSpot-RateLimit-Interval-Milliseconds")) / 1000
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._refill()
+            self.capacity = float(limit)
+            self.rate = limit / interval
+            self.tokens = min(self.tokens, float(remaining))
+
+    def penalize(self, seconds):
+        """Esvazia o bucket para que ninguém chame a API durante `seconds`"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - self.rate * seconds
+
+
+class HubSpotClient:
+    def __init__(self, config, bucket=None):
+        self.config = config
+        self.bucket = bucket or TokenBucket(config.HUBSPOT_RATE_LIMIT)
+        self.calls = 0
+
+    def _backoff(self, attempt):
+        delay = min(self.config.HUBSPOT_MAX_BACKOFF, 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def request(self, method, path, params=None, body=None):
+        url = self.config.HUBSPOT_BASE_URL.rstrip("/") + path
+        if params:
+            url += "?" + urlencode(params)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self.config.HUBSPOT_TOKEN:
+            headers["Authorization"] = f"Bearer {self.config.HUBSPOT_TOKEN}"
+
+        for attempt in range(self.config.HUBSPOT_MAX_RETRIES + 1):
+            self.bucket.acquire()
+            self.calls += 1
+            request = urllib.request.Request(url, data=data, headers=headers, method=method)
+            try:
+                with urllib.request.urlopen(request, timeout=self.config.HUBSPOT_TIMEOUT) as response:
+                    self.bucket.update(response.headers)
+                    return json.load(response)
+            except urllib.error.HTTPError as e:
+                self.bucket.update(e.headers)
+                if e.code != 429 and e.code < 500:
+                    raise ExtractError(f"{method} {path} falhou com HTTP {e.code}: {e.read()[:200]!r}") from e
+                retry_after = e.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after else self._backoff(attempt)
+                if e.code == 429:
+                    self.bucket.penalize(delay)
+                reason = f"HubSpot HTTP {e.code} em {path}"
+            except RETRYABLE_ERRORS as e:
+                delay = self._backoff(attempt)
+                reason = f"Erro de rede em {path} ({e})"
+            if attempt == self.config.HUBSPOT_MAX_RETRIES:
+                # Última tentativa: falha já, sem esperar um backoff que não leva a lugar nenhum
+                logger.warning(reason)
+                break
+            logger.warning(f"{reason}, nova tentativa em {delay:.1f}s")
+            time.sleep(delay)
+
+        raise ExtractError(f"{method} {path} falhou após {self.config.HUBSPOT_MAX_RETRIES} tentativas")
+
+    def paginate(self, path, params):
+        """Páginas de um endpoint GET paginado por cursor `after`"""
+        params = dict(params)
+        while True:
+            page = self.request("GET", path, params)
+            yield page.get("results", [])
+            after = page.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                return
+            params["after"] = after
+
+    def search(self, path, body):
+        """Páginas do endpoint de busca (POST) paginado por cursor `after`"""
+        body = dict(body)
+        while True:
+            page = self.request("POST", path, body=body)
+            yield page.get("results", [])
+            after = page.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                return
+            body["after"] = after
+
+
+def _date_part(value):
+    return value[:10] if value else None
+
+
+def _deal_properties(config):
+    return {
+        "data_negocio_criado": "createdate",
+        "data_agendamento": config.HUBSPOT_PROP_DATA_AGENDAMENTO,
+        "nome_negocio": "dealname",
+        "etapa_id": "dealstage",
+        "valor": "amount",
+        "funil": "pipeline",
+        "origem": config.HUBSPOT_PROP_ORIGEM,
+        "canal": config.HUBSPOT_PROP_CANAL,
+        "detalhes": "description",
+        "owner_id": "hubspot_owner_id",
+    }
+
+
+def deal_row(config, deal):
+    props = deal.get("properties", {})
+    mapping = _deal_properties(config)
+    row = {"deal_id": deal["id"]}
+    for column, prop in mapping.items():
+        row[column] = props.get(prop)
+    row["data_negocio_criado"] = _date_part(row["data_negocio_criado"])
+    row["data_agendamento"] = _date_part(row["data_agendamento"])
+    return [row[column] for column in LANDING_COLUMNS["fato_deal"]]
+
+
+def owner_row(owner):
+    name = " ".join(p for p in (owner.get("firstName"), owner.get("lastName")) if p)
+    return [owner["id"], name or owner.get("email")]
+
+
+def stage_rows(pipeline):
+    return [[stage["id"], pipeline.get("label"), stage.get("label")] for stage in pipeline.get("stages", [])]
+
+
+class Extractor:
+    """Extrai deals, owners e etapas com requisições concorrentes limitadas.
+
+    Produtores (threads) buscam páginas e as colocam numa fila limitada; a
+    thread principal faz COPY de cada página numa tabela temporária e, no fim,
+    substitui (carga completa) ou mescla por deal_id (incremental) a landing.
+    """
+
+    def __init__(self, db, client=None):
+        self.db = db
+        self.config = db.config
+        self.client = client or HubSpotClient(db.config)
+        self._max_modified = None
+        self._lock = threading.Lock()
+
+    def _track_modified(self, deals):
+        values = [d.get("properties", {}).get("hs_lastmodifieddate") for d in deals]
+        values = [v for v in values if v]
+        if values:
+            with self._lock:
+                self._max_modified = max([self._max_modified or ""] + values)
+
+    def _owner_pages(self):
+        for owners in self.client.paginate("/crm/v3/owners", {"limit": 100}):
+            yield [owner_row(o) for o in owners]
+
+    def _stage_pages(self):
+        page = self.client.request("GET", "/crm/v3/pipelines/deals")
+        yield [row for pipeline in page.get("results", []) for row in stage_rows(pipeline)]
+
+    def _deal_pages_full(self):
+        properties = ",".join(_deal_properties(self.config).values()) + ",hs_lastmodifieddate"
+        for deals in self.client.paginate("/crm/v3/objects/deals", {"limit": 100, "properties": properties}):
+            self._track_modified(deals)
+            yield [deal_row(self.config, d) for d in deals]
+
+    def _deal_pages_window(self, start_ms, end_ms):
+        body = {
+            "filterGroups": [{"filters": [
+                {"propertyName": "hs_lastmodifieddate", "operator": "GTE", "value": str(start_ms)},
+                {"propertyName": "hs_lastmodifieddate", "operator": "LT", "value": str(end_ms)},
+            ]}],
+            "sorts": [{"propertyName": "hs_lastmodifieddate", "direction": "ASCENDING"}],
+            "properties": list(_deal_properties(self.config).values()) + ["hs_lastmodifieddate"],
+            "limit": 100,
+        }
+        for deals in self.client.search("/crm/v3/objects/deals/search", body):
+            self._track_modified(deals)
+            yield [deal_row(self.config, d) for d in deals]
+
+    def _deal_windows(self, since):
+        """Divide [since, agora] em janelas buscadas em paralelo (e abaixo do teto da busca)"""
+        start = int(since.timestamp() * 1000)
+        end = int(datetime.now(timezone.utc).timestamp() * 1000) + 1
+        windows = max(1, self.config.HUBSPOT_SEARCH_WINDOWS)
+        step = max(1, (end - start) // windows)
+        bounds = list(range(start, end, step)) + [end]
+        return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+    def _read_watermark(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(compose("""
+            CREATE TABLE IF NOT EXISTS {extract_state} (
+                object TEXT PRIMARY KEY,
+                last_modified TIMESTAMPTZ,
+                extracted_at TIMESTAMPTZ
+            )""", extract_state=self.config.extract_state_table))
+            cursor.execute(compose(
+                "SELECT last_modified FROM {extract_state} WHERE object = 'deals'",
+                extract_state=self.config.extract_state_table
+            ))
+            row = cursor.fetchone()
+        conn.commit()
+        return row[0] if row else None
+
+    def _copy_rows(self, cursor, table, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(ident(table), column_list(columns))
+        cursor.copy_expert(copy.as_string(cursor), buffer)
+
+    def run(self, full=False):
+        start = time.time()
+        with self.db.get_connection() as conn:
+            for table_type in LANDING_COLUMNS:
+                create_landing_table(self.db, conn, table_type)
+
+            since = None if full else self._read_watermark(conn)
+            if since is not None:
+                since -= timedelta(seconds=self.config.HUBSPOT_OVERLAP_SECONDS)
+
+            producers = [("dim_owners", self._owner_pages), ("dim_etapa", self._stage_pages)]
+            if since is None:
+                producers.append(("fato_deal", self._deal_pages_full))
+            else:
+                for window in self._deal_windows(since):
+                    producers.append(("fato_deal", lambda w=window: self._deal_pages_window(*w)))
+
+            pages = queue.Queue(maxsize=self.config.HUBSPOT_QUEUE_PAGES)
+            stop = threading.Event()
+
+            def put(item):
+                # Fila limitada mantém a memória constante; `stop` libera produtores se o consumo falhar
+                while not stop.is_set():
+                    try:
+                        pages.put(item, timeout=0.5)
+                        return True
+                    except queue.Full:
+                        continue
+                return False
+
+            def produce(table_type, page_factory):
+                try:
+                    for rows in page_factory():
+                        if not put((table_type, rows, None)):
+                            return
+                except Exception as e:
+                    put((table_type, None, e))
+                finally:
+                    put((table_type, None, StopIteration))
+
+            counts = {table_type: 0 for table_type in LANDING_COLUMNS}
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = 0")
+                    for table_type in LANDING_COLUMNS:
+                        cursor.execute(compose("""
+                        CREATE TEMP TABLE {staging} (LIKE {landing})
+                        ON COMMIT DROP""", staging=f"stg_{table_type}", landing=landing_table(self.config, table_type)))
+
+                    with ThreadPoolExecutor(max_workers=self.config.HUBSPOT_MAX_CONCURRENCY) as executor:
+                        for table_type, factory in producers:
+                            executor.submit(produce, table_type, factory)
+
+                        try:
+                            running = len(producers)
+                            while running:
+                                table_type, rows, error = pages.get()
+                                if error is StopIteration:
+                                    running -= 1
+                                elif error is not None:
+                                    raise ExtractError(f"Falha extraindo {table_type}: {error}") from error
+                                elif rows:
+                                    self._copy_rows(cursor, f"stg_{table_type}", LANDING_COLUMNS[table_type], rows)
+                                    counts[table_type] += len(rows)
+                        finally:
+                            stop.set()
+
+                    self._merge(cursor, incremental=since is not None)
+                    if self._max_modified:
+                        cursor.execute(compose("""
+                        INSERT INTO {extract_state} (object, last_modified, extracted_at)
+                        VALUES ('deals', %s, now())
+                        ON CONFLICT (object) DO UPDATE SET
+                            last_modified = GREATEST({extract_state}.last_modified, EXCLUDED.last_modified),
+                            extracted_at = EXCLUDED.extracted_at
+                        """, extract_state=self.config.extract_state_table), (self._max_modified,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        mode = "completa" if since is None else f"incremental desde {since.isoformat()}"
+        logger.info(
+            f"📡 Extração {mode} concluída em {time.time() - start:.1f}s "
+            f"({self.client.calls} chamadas): {counts}"
+        )
+        return counts
+
+    def _merge(self, cursor, incremental):
+        for table_type in ("dim_etapa", "dim_owners"):
+            target = landing_table(self.config, table_type)
+            cursor.execute(compose("TRUNCATE TABLE {target}", target=target))
+            cursor.execute(compose(
+                "INSERT INTO {target} SELECT DISTINCT * FROM {staging}", target=target, staging=f"stg_{table_type}"
+            ))
+
+        target = landing_table(self.config, "fato_deal")
+        if incremental:
+            cursor.execute(compose(
+                "DELETE FROM {target} t USING stg_fato_deal s WHERE t.deal_id = s.deal_id", target=target
+            ))
+        else:
+            cursor.execute(compose("TRUNCATE TABLE {target}", target=target))
+        cursor.execute(compose("""
+        INSERT INTO {target}
+        SELECT DISTINCT ON (deal_id) * FROM stg_fato_deal ORDER BY deal_id
+        """, target=target))
+
+
+def extract(db=None, full=False):
+    """Extrai do HubSpot para as tabelas de landing; incremental se houver watermark.
+
+    Exclusões no HubSpot só são refletidas numa extração completa (--full).
+    """
+    return Extractor(db or Database()).run(full=full)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extrai deals, owners e etapas da API do HubSpot")
+    parser.add_argument("--full", action="store_true", help="Ignora o watermark e recarrega tudo")
+    args = parser.parse_args(argv)
+    extract(full=args.full)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,191 @@
+# src/health.py
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.config import Config
+from src.logger import logger
+
+
+class RunState:
+    """Estado em memória de um runner (drone ou pipeline), servido pelo endpoint de saúde.
+
+    "Fresco" significa que a última verificação terminou bem: ou o run teve
+    sucesso, ou a origem estava inalterada e os dados publicados seguem atuais.
+    Até a primeira verificação terminar o runner é reportado como "starting".
+    """
+
+    def __init__(self, name, max_staleness=None):
+        self.name = name
+        self.max_staleness = max_staleness or Config.HEALTH_MAX_STALENESS
+        self.started_at = time.time()
+        self._stages = []
+        self.run_started_at = None
+        self.last_success_at = None
+        self.last_fresh_at = None
+        self.last_failure_at = None
+        self.last_error = None
+        self.last_duration = None
+        self.runs = 0
+        self.failures = 0
+        self.skips = 0
+        self.consecutive_failures = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Marca um estágio ativo; estágios em threads paralelas convivem na lista"""
+        entry = (threading.get_ident(), name)
+        with self._lock:
+            self._stages.append(entry)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stages.remove(entry)
+
+    @property
+    def current_stage(self):
+        """Estágio iniciado mais recentemente entre os que ainda estão ativos"""
+        with self._lock:
+            return self._current_stage()
+
+    def _current_stage(self):
+        return self._stages[-1][1] if self._stages else None
+
+    def run_started(self):
+        with self._lock:
+            self.run_started_at = time.time()
+
+    def run_finished(self, success, duration=None, error=None):
+        now = time.time()
+        with self._lock:
+            self.runs += 1
+            self.last_duration = duration if duration is not None else now - (self.run_started_at or now)
+            self.run_started_at = None
+            if success:
+                self.last_success_at = self.last_fresh_at = now
+                self.consecutive_failures = 0
+                self.last_error = None
+            else:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_failure_at = now
+                self.last_error = error
+
+    def record_skip(self):
+        with self._lock:
+            self.skips += 1
+            self.last_fresh_at = time.time()
+
+    def status(self):
+        """(saudável, payload) a partir apenas do estado em memória"""
+        now = time.time()
+        with self._lock:
+            lag = None if self.last_fresh_at is None else now - self.last_fresh_at
+            payload = {
+                "name": self.name,
+                "uptime": now - self.started_at,
+                "current_stage": self._current_stage(),
+                "active_stages": [name for _, name in self._stages],
+                "running_for": None if self.run_started_at is None else now - self.run_started_at,
+                "last_success_at": self.last_success_at,
+                "last_failure_at": self.last_failure_at,
+                "last_error": self.last_error,
+                "freshness_lag": lag,
+                "max_staleness": self.max_staleness,
+                "last_duration": self.last_duration,
+                "runs": self.runs,
+                "failures": self.failures,
+                "skips": self.skips,
+                "consecutive_failures": self.consecutive_failures,
+            }
+        # Antes da primeira verificação terminar o runner conta como saudável ("starting"),
+        # senão quem depende dele no compose (service_healthy) fica preso no cold start
+        starting = lag is None and payload["runs"] == 0
+        healthy = starting or (lag is not None and lag <= self.max_staleness)
+        payload["status"] = "starting" if starting else "ok" if healthy else "stale"
+        return healthy, payload
+
+
+def _prometheus(payload, prefix="etl"):
+    """Exposição no formato texto do Prometheus (só os campos numéricos)"""
+    lines = []
+
+    def emit(values, labels):
+        label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                lines.append(f"{prefix}_{key}{{{label_text}}} {value}")
+
+    emit(payload, {"runner": payload.get("name", "")})
+    for tenant, values in (payload.get("tenants") or {}).items():
+        emit(values, {"runner": payload.get("name", ""), "tenant": tenant})
+    return "\n".join(lines) + "\n"
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        healthy, payload = self.server.status_fn()
+        if self.path.rstrip("/") in ("", "/health"):
+            self._send(200 if healthy else 503, json.dumps(payload, default=str), "application/json")
+        elif self.path == "/metrics":
+            self._send(200, _prometheus(payload), "text/plain; version=0.0.4")
+        else:
+            self._send(404, json.dumps({"error": "not found"}), "application/json")
+
+
+def start_health_server(status_fn, port=None):
+    """Sobe o endpoint numa thread daemon; HEALTH_PORT=0 desliga"""
+    port = Config.HEALTH_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), HealthHandler)
+    except OSError as e:
+        logger.warning(f"Endpoint de saúde indisponível na porta {port}: {e}")
+        return None
+    server.daemon_threads = True
+    server.status_fn = status_fn
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"🩺 Health endpoint listening on :{server.server_address[1]}")
+    return server
+
+
+def probe(port=None, timeout=3):
+    """Healthcheck do container: 0 se o endpoint local responde 200"""
+    port = port or Config.HEALTH_PORT
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=timeout) as response:
+            return 0 if response.status == 200 else 1
+    except Exception:
+        return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe do endpoint de saúde local")
+    parser.add_argument("command", choices=["probe"])
+    parser.add_argument("--port", type=int)
+    args = parser.parse_args(argv)
+    sys.exit(probe(args.port))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
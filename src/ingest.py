@@ -0,0 +1,260 @@
+# src/ingest.py
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from psycopg2 import sql
+from src.database import Database
+from src.logger import logger
+from src.sql import compose, ident, columns as column_list
+
+# Colunas das tabelas de landing (public.*_hubspot)
+LANDING_COLUMNS = {
+    "dim_etapa": ["etapa_id", "pipeline", "etapa"],
+    "dim_owners": ["owner_id", "owner_name"],
+    "fato_deal": [
+        "deal_id", "data_negocio_criado", "data_agendamento", "nome_negocio",
+        "etapa_id", "valor", "funil", "origem", "canal", "detalhes", "owner_id"
+    ],
+}
+
+
+def landing_table(config, table_type):
+    return getattr(config, f"{table_type}_source")
+
+
+def create_landing_table(db, conn, table_type):
+    """Cria a tabela de landing (tudo TEXT) caso ainda não exista"""
+    columns = ",\n".join(f"    {column} TEXT" for column in LANDING_COLUMNS[table_type])
+    with conn.cursor() as cursor:
+        cursor.execute(compose(
+            "CREATE TABLE IF NOT EXISTS {table} (\n" + columns + "\n)",
+            table=landing_table(db.config, table_type)
+        ))
+        cursor.execute(compose("""
+        CREATE TABLE IF NOT EXISTS {ledger} (
+            sha256 TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            rows BIGINT,
+            bytes BIGINT,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )""", ledger=db.config.ingest_ledger_table))
+    conn.commit()
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_text(path):
+    """Abre o arquivo descomprimindo em streaming conforme a extensão"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError("Arquivos .zst requerem o pacote zstandard") from e
+        raw = open(path, "rb")
+        return io.TextIOWrapper(
+            zstandard.ZstdDecompressor().stream_reader(raw, closefd=True),
+            encoding="utf-8", newline=""
+        )
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def detect_format(path):
+    base = path[:-3] if path.endswith(".gz") else path[:-4] if path.endswith(".zst") else path
+    return "jsonl" if base.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def _copy_csv(cursor, table, stream, columns):
+    """COPY direto do arquivo CSV, usando o cabeçalho como lista de colunas.
+
+    Só aceita CSV no formato da landing (cabeçalho com os nomes de LANDING_COLUMNS).
+    Os CSVs exportados pela interface do HubSpot trazem rótulos ("Deal Stage",
+    "Deal owner") em vez de ids; para eles use o export JSONL da API.
+    """
+    header = next(csv.reader([stream.readline()]))
+    header = [h.strip() for h in header]
+    unknown = [h for h in header if h not in columns]
+    if unknown:
+        raise ValueError(
+            f"Colunas desconhecidas para {table}: {unknown}. CSV precisa do cabeçalho "
+            f"da landing ({', '.join(columns)}); exports do HubSpot devem vir em JSONL"
+        )
+    copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(ident(table), column_list(header))
+    cursor.copy_expert(copy.as_string(cursor), stream)
+    return cursor.rowcount
+
+
+def _jsonl_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _record_rows(config, table_type, columns):
+    """Função registro JSON -> linhas da landing.
+
+    Aceita objetos da API do HubSpot (deal com "properties", owner, pipeline com
+    "stages"), mapeados como no extractor, ou registros já com as colunas da
+    landing. Registro sem nenhuma coluna conhecida é erro, não linha vazia.
+    """
+    from src.extractor import deal_row, owner_row, stage_rows
+
+    def to_rows(record):
+        if not isinstance(record, dict):
+            raise ValueError("registro não é um objeto JSON")
+        if table_type == "fato_deal" and isinstance(record.get("properties"), dict) and "id" in record:
+            return [deal_row(config, record)]
+        if table_type == "dim_owners" and "id" in record and \
+                any(key in record for key in ("firstName", "lastName", "email")):
+            return [owner_row(record)]
+        if table_type == "dim_etapa" and isinstance(record.get("stages"), list):
+            return stage_rows(record)
+        if not any(column in record for column in columns):
+            raise ValueError(f"registro sem colunas conhecidas: {sorted(record)[:10]}")
+        return [[_jsonl_value(record.get(column)) for column in columns]]
+
+    return to_rows
+
+
+def _copy_jsonl(cursor, table, stream, columns, chunk_rows, to_rows):
+    """Converte o JSONL em blocos de chunk_rows linhas para CSV em memória e faz COPY de cada bloco"""
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+    copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(ident(table), column_list(columns))
+    copy = copy.as_string(cursor)
+
+    def flush():
+        buffer.seek(0)
+        cursor.copy_expert(copy, buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            rows = to_rows(json.loads(line))
+        except (ValueError, KeyError) as e:
+            raise ValueError(f"Linha {number} inválida para {table}: {e}") from e
+        writer.writerows(rows)
+        pending += len(rows)
+        if pending >= chunk_rows:
+            flush()
+            total += pending
+            pending = 0
+
+    if pending:
+        flush()
+        total += pending
+    return total
+
+
+def ingest_file(db, table_type, path):
+    """Carrega um arquivo numa transação junto com o registro no ledger de checksums"""
+    checksum = file_checksum(path)
+    table = landing_table(db.config, table_type)
+    columns = LANDING_COLUMNS[table_type]
+
+    with db.get_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = 0")
+                # O INSERT no ledger serializa cargas concorrentes do mesmo arquivo
+                cursor.execute(compose("""
+                INSERT INTO {ledger} (sha256, file_name, table_name, bytes)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (sha256) DO NOTHING
+                """, ledger=db.config.ingest_ledger_table), (checksum, os.path.basename(path), table, os.path.getsize(path)))
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    logger.info(f"⏭ {path} já carregado (sha256 {checksum[:12]})")
+                    return 0
+
+                with open_text(path) as stream:
+                    if detect_format(path) == "jsonl":
+                        rows = _copy_jsonl(
+                            cursor, table, stream, columns, db.config.INGEST_CHUNK_ROWS,
+                            _record_rows(db.config, table_type, columns)
+                        )
+                    else:
+                        rows = _copy_csv(cursor, table, stream, columns)
+
+                cursor.execute(
+                    compose("UPDATE {ledger} SET rows = %s WHERE sha256 = %s", ledger=db.config.ingest_ledger_table),
+                    (rows, checksum)
+                )
+            conn.commit()
+            logger.info(f"📥 {path}: {rows} linhas carregadas em {table}")
+            return rows
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Falha ao carregar {path}: {e}")
+            raise
+
+
+def ingest_files(db, table_type, paths, workers=None, replace=False):
+    """Carrega vários arquivos em paralelo, cada um na sua conexão"""
+    with db.get_connection() as conn:
+        create_landing_table(db, conn, table_type)
+        if replace:
+            table = landing_table(db.config, table_type)
+            with conn.cursor() as cursor:
+                cursor.execute(compose("TRUNCATE TABLE {table}", table=table))
+                cursor.execute(
+                    compose("DELETE FROM {ledger} WHERE table_name = %s", ledger=db.config.ingest_ledger_table),
+                    (table,)
+                )
+            conn.commit()
+            logger.info(f"Tabela {table} truncada para recarga completa")
+
+    workers = workers or db.config.INGEST_WORKERS
+    total, failures = 0, 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ingest_file, db, table_type, path): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                total += future.result()
+            except Exception:
+                failures += 1
+
+    logger.info(f"Ingestão de {table_type} concluída: {total} linhas, {failures} arquivos com falha")
+    if failures:
+        raise Exception(f"{failures} arquivo(s) falharam na ingestão de {table_type}")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Carrega exports do HubSpot (CSV/JSONL) nas tabelas de landing",
+        epilog="JSONL: objetos da API do HubSpot ou registros com as colunas da landing. "
+               "CSV: apenas com o cabeçalho da landing."
+    )
+    parser.add_argument("table_type", choices=sorted(LANDING_COLUMNS))
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--replace", action="store_true", help="Trunca a landing antes de carregar")
+    args = parser.parse_args(argv)
+
+    ingest_files(Database(), args.table_type, args.files, args.workers, args.replace)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
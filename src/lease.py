@@ -0,0 +1,196 @@
+# src/lease.py
+import os
+import time
+import socket
+from contextlib import contextmanager
+from src.logger import logger
+from src.sql import compose
+
+# Primeiro inteiro da chave de advisory lock, isola as chaves deste ETL
+LOCK_NAMESPACE = 0x4855
+
+# Saída de `python -m src.etl` quando a reconstrução de outro processo foi reaproveitada
+REUSED_EXIT_CODE = 75
+# Resultado de um estágio que reaproveitou outra reconstrução (verdadeiro: não é falha)
+REUSED = "reused"
+
+
+def run_outcome(returncode):
+    """Código de saída de `python -m src.etl` -> True, False ou REUSED"""
+    if returncode == REUSED_EXIT_CODE:
+        return REUSED
+    return returncode == 0
+
+
+class LeaseTimeout(Exception):
+    """Raised when a lease could not be obtained within LEASE_WAIT_TIMEOUT"""
+
+
+class Lease:
+    """Estado de um lease: `acquired` quando este processo deve reconstruir,
+    `reused` quando outro processo concluiu a reconstrução enquanto esperávamos"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.acquired = False
+        self.reused = False
+        self.completed = False
+        self._db = None
+        self._conn = None
+
+    def heartbeat(self, worker=None):
+        """Renova o lease; chamado pela carga a cada etapa concluída, não por uma thread.
+
+        worker é a conexão que faz a reconstrução: o pid dela fica no lease para
+        que um holder travado seja expirado junto com o backend que trabalha.
+        """
+        if not self.acquired or self._conn is None or self._conn.closed:
+            return
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute(compose("""
+                UPDATE {leases}
+                SET heartbeat_at = now(), worker_pid = COALESCE(%s, worker_pid)
+                WHERE resource = %s AND pid = pg_backend_pid()
+                """, leases=self._db.config.lease_table),
+                    (worker.get_backend_pid() if worker is not None else None, self.resource))
+        except Exception as e:
+            logger.error(f"Falha no heartbeat do lease {self.resource}: {e}")
+
+    def complete(self):
+        """Marca a reconstrução como concluída; waiters passam a reaproveitá-la"""
+        self.completed = True
+
+
+def create_lease_table(db, conn):
+    with conn.cursor() as cursor:
+        cursor.execute(compose("""
+        CREATE TABLE IF NOT EXISTS {leases} (
+            resource TEXT PRIMARY KEY,
+            holder TEXT,
+            pid INTEGER,
+            acquired_at TIMESTAMPTZ,
+            heartbeat_at TIMESTAMPTZ,
+            completed_at TIMESTAMPTZ
+        );
+        ALTER TABLE {leases} ADD COLUMN IF NOT EXISTS worker_pid INTEGER;""", leases=db.config.lease_table))
+
+
+def _try_lock(conn, resource):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(%s, hashtext(%s))",
+            (LOCK_NAMESPACE, resource)
+        )
+        return cursor.fetchone()[0]
+
+
+def _unlock(conn, resource):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_unlock(%s, hashtext(%s))",
+            (LOCK_NAMESPACE, resource)
+        )
+
+
+def _expire_stale_holder(db, conn, resource):
+    """Encerra os backends do holder (lease e carga) se o heartbeat parou além do TTL"""
+    with conn.cursor() as cursor:
+        cursor.execute(compose("""
+        SELECT l.pid, l.worker_pid, l.holder
+        FROM {leases} l
+        JOIN pg_locks k ON k.pid = l.pid
+            AND k.locktype = 'advisory'
+            AND k.classid = %s
+            AND k.objid = hashtext(%s)::oid
+            AND k.granted
+        WHERE l.resource = %s
+        AND l.heartbeat_at < now() - make_interval(secs => %s)
+        """, leases=db.config.lease_table), (LOCK_NAMESPACE, resource, resource, db.config.LEASE_TTL))
+        stale = cursor.fetchone()
+        if not stale:
+            return
+        pid, worker_pid, holder = stale
+        logger.warning(f"Lease {resource} expirado (holder {holder}, pid {pid}, carga {worker_pid}) - encerrando sessões")
+        try:
+            # Primeiro a carga, para ela não seguir ao lado da reconstrução de quem assumir o lease
+            if worker_pid and worker_pid != pid:
+                cursor.execute("SELECT pg_terminate_backend(%s)", (worker_pid,))
+            cursor.execute("SELECT pg_terminate_backend(%s)", (pid,))
+        except Exception as e:
+            logger.error(f"Não foi possível expirar o lease {resource}: {e}")
+
+
+@contextmanager
+def table_lease(db, resource):
+    """Lease por tabela baseado em advisory lock do PostgreSQL.
+
+    `resource` é o nome da tabela de destino (schema.tabela), então tenants que
+    dividem o banco não disputam o mesmo lease. Quem obtém o lock reconstrói e chama lease.complete(). Quem encontra uma
+    reconstrução em andamento espera por ela e, se ela terminar com sucesso,
+    recebe lease.reused=True e não repete o trabalho. O lock é de sessão, então
+    cai sozinho se o holder morrer. O holder renova o heartbeat entre as etapas
+    da carga (db.heartbeat); se ele parar além de LEASE_TTL, quem espera encerra
+    a sessão do lease e a da carga.
+    """
+    lease = Lease(resource)
+    with db.get_connection() as conn:
+        conn.autocommit = True
+        create_lease_table(db, conn)
+
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT now()")
+            wait_start = cursor.fetchone()[0]
+
+        deadline = time.time() + db.config.LEASE_WAIT_TIMEOUT
+        waited = False
+        while not _try_lock(conn, resource):
+            if not waited:
+                logger.info(f"🔒 {resource} sendo reconstruída por outro processo - aguardando")
+                waited = True
+            if time.time() > deadline:
+                raise LeaseTimeout(f"Timeout aguardando lease de {resource}")
+            _expire_stale_holder(db, conn, resource)
+            time.sleep(db.config.LEASE_POLL_INTERVAL)
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(compose("""
+                SELECT completed_at >= %s FROM {leases} WHERE resource = %s
+                """, leases=db.config.lease_table), (wait_start, resource))
+                row = cursor.fetchone()
+
+            if waited and row and row[0]:
+                logger.info(f"♻️ {resource} reconstruída por outro processo - reaproveitando resultado")
+                lease.reused = True
+                yield lease
+                return
+
+            with conn.cursor() as cursor:
+                cursor.execute(compose("""
+                INSERT INTO {leases} (resource, holder, pid, worker_pid, acquired_at, heartbeat_at)
+                VALUES (%s, %s, pg_backend_pid(), NULL, now(), now())
+                ON CONFLICT (resource) DO UPDATE SET
+                    holder = EXCLUDED.holder,
+                    pid = EXCLUDED.pid,
+                    worker_pid = EXCLUDED.worker_pid,
+                    acquired_at = EXCLUDED.acquired_at,
+                    heartbeat_at = EXCLUDED.heartbeat_at
+                """, leases=db.config.lease_table), (resource, f"{socket.gethostname()}:{os.getpid()}"))
+
+            lease.acquired = True
+            lease._db, lease._conn = db, conn
+            previous, db.lease = db.lease, lease
+            try:
+                yield lease
+            finally:
+                db.lease = previous
+
+            if lease.completed:
+                with conn.cursor() as cursor:
+                    cursor.execute(compose("""
+                    UPDATE {leases} SET completed_at = now() WHERE resource = %s
+                    """, leases=db.config.lease_table), (resource,))
+        finally:
+            if not conn.closed:
+                _unlock(conn, resource)
@@ -1,15 +1,45 @@
 import logging
 import sys
+import threading
+from contextlib import contextmanager
+
+# Tenant da thread atual, prefixado nas mensagens quando há vários portais
+_context = threading.local()
+
+
+class _TenantFilter(logging.Filter):
+    def filter(self, record):
+        tenant = getattr(_context, "tenant", None)
+        if tenant:
+            record.msg = f"[{tenant}] {record.msg}"
+        return True
+
+
+@contextmanager
+def tenant_context(name):
+    """Marca os logs emitidos pela thread atual com o nome do tenant"""
+    previous = getattr(_context, "tenant", None)
+    _context.tenant = name
+    try:
+        yield
+    finally:
+        _context.tenant = previous
+
+
+def current_tenant():
+    return getattr(_context, "tenant", None)
+
 
 def setup_logger(name=__name__):
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    
+
     handler = logging.StreamHandler(sys.stdout)
     handler.setFormatter(logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     ))
-    
+    handler.addFilter(_TenantFilter())
+
     logger.addHandler(handler)
     return logger
 
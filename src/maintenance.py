@@ -0,0 +1,140 @@
+# src/maintenance.py
+import time
+from psycopg2 import sql
+from src.logger import logger
+from src.sql import columns as column_list, compose, ident
+
+
+def extended_statistics(config):
+    """Grupos de colunas de MAINTENANCE_EXTENDED_STATS, ex.: "funil,canal,origem;funil,origem" """
+    groups = []
+    for group in config.MAINTENANCE_EXTENDED_STATS.split(';'):
+        names = tuple(name.strip() for name in group.split(',') if name.strip())
+        # CREATE STATISTICS exige ao menos duas colunas
+        if len(names) >= 2:
+            groups.append(names)
+    return groups
+
+
+def create_maintenance_log_table(db, conn):
+    """Cria a tabela de registro da manutenção de forma idempotente"""
+    with conn.cursor() as cursor:
+        cursor.execute(compose("""
+        CREATE TABLE IF NOT EXISTS {maintenance_log} (
+            run_id TEXT,
+            executed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            table_name TEXT NOT NULL,
+            action TEXT NOT NULL,
+            duration DOUBLE PRECISION NOT NULL,
+            live_tuples BIGINT,
+            dead_tuples BIGINT,
+            detail TEXT
+        );
+        CREATE INDEX IF NOT EXISTS etl_maintenance_log_executed_at_idx
+            ON {maintenance_log} (executed_at);
+        """, maintenance_log=db.config.maintenance_log_table))
+
+
+def _tuple_counts(cursor, table_name):
+    cursor.execute(
+        "SELECT n_live_tup, n_dead_tup FROM pg_stat_user_tables WHERE relid = %s::regclass",
+        (table_name,)
+    )
+    row = cursor.fetchone()
+    return row if row else (None, None)
+
+
+def _table_columns(cursor, table_name):
+    schema, table = table_name.split('.')
+    cursor.execute("""
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = %s AND table_name = %s
+    """, (schema, table))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _timed(cursor, statement):
+    start = time.monotonic()
+    cursor.execute(statement)
+    return time.monotonic() - start
+
+
+def maintain_table(db, conn, table_name, statistics=()):
+    """Estatísticas estendidas declaradas, depois ANALYZE ou VACUUM (ANALYZE).
+
+    VACUUM só entra quando a fração de tuplas mortas passa de
+    MAINTENANCE_VACUUM_THRESHOLD. Retorna as ações executadas.
+    """
+    actions = []
+    with conn.cursor() as cursor:
+        if statistics:
+            existing = _table_columns(cursor, table_name)
+            for group in statistics:
+                missing = [name for name in group if name not in existing]
+                if missing:
+                    logger.info(f"Estatística ({', '.join(group)}) ignorada em {table_name}: sem {missing}")
+                    continue
+                name = f"{table_name}_{'_'.join(group)}_stats"
+                duration = _timed(cursor, sql.SQL("CREATE STATISTICS IF NOT EXISTS {} ON {} FROM {}").format(
+                    ident(name), column_list(group), ident(table_name)
+                ))
+                actions.append(("create_statistics", duration, None, None, ", ".join(group)))
+
+        live, dead = _tuple_counts(cursor, table_name)
+        ratio = (dead or 0) / max(live or 0, 1)
+        if dead and ratio >= db.config.MAINTENANCE_VACUUM_THRESHOLD:
+            action = "vacuum_analyze"
+            duration = _timed(cursor, compose("VACUUM (ANALYZE) {table}", table=table_name))
+        else:
+            action = "analyze"
+            duration = _timed(cursor, compose("ANALYZE {table}", table=table_name))
+        actions.append((action, duration, live, dead, f"dead_ratio={ratio:.4f}"))
+
+    for action, duration, _, _, detail in actions:
+        logger.info(f"🧹 {table_name}: {action} em {duration:.2f}s ({detail})")
+    return actions
+
+
+def run_maintenance(db, conn, tables, run_id=None, statistics=None):
+    """Estágio pós-carga: mantém as tabelas recém-carregadas antes das validações e FKs.
+
+    Roda em autocommit (VACUUM não aceita bloco de transação) e sem
+    statement_timeout. A carga já foi confirmada, então falhas aqui só geram
+    aviso. statistics mapeia tabela -> grupos de colunas para CREATE STATISTICS.
+    """
+    if not db.config.MAINTENANCE_ENABLED:
+        return []
+    statistics = statistics or {}
+    conn.commit()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    records = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET statement_timeout = 0")
+        for table_name in tables:
+            try:
+                actions = maintain_table(db, conn, table_name, statistics.get(table_name, ()))
+            except Exception as e:
+                logger.warning(f"Manutenção de {table_name} falhou: {e}")
+                continue
+            records.extend((run_id, table_name, *action) for action in actions)
+            db.heartbeat(conn)
+
+        if records:
+            create_maintenance_log_table(db, conn)
+            with conn.cursor() as cursor:
+                cursor.executemany(compose("""
+                INSERT INTO {maintenance_log}
+                    (run_id, table_name, action, duration, live_tuples, dead_tuples, detail)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, maintenance_log=db.config.maintenance_log_table), records)
+    except Exception as e:
+        logger.warning(f"Falha ao registrar manutenção: {e}")
+    finally:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("RESET statement_timeout")
+        finally:
+            conn.autocommit = autocommit
+    return records
@@ -0,0 +1,204 @@
+# src/mock_hubspot.py
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from src.logger import logger
+
+
+class MockHubSpotData:
+    """Dados determinísticos de pipelines, owners e deals para testes e benchmarks"""
+
+    def __init__(self, deals=1000, owners=20, pipelines=2, stages_per_pipeline=5, seed=42):
+        rng = random.Random(seed)
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        self.pipelines = []
+        for p in range(pipelines):
+            self.pipelines.append({
+                "id": f"pipeline_{p}",
+                "label": f"Funil {p}",
+                "stages": [
+                    {"id": f"stage_{p}_{s}", "label": f"Etapa {s}", "displayOrder": s}
+                    for s in range(stages_per_pipeline)
+                ],
+            })
+        stage_ids = [(p["id"], s["id"]) for p in self.pipelines for s in p["stages"]]
+
+        self.owners = [
+            {"id": str(100 + o), "firstName": "Owner", "lastName": str(o), "email": f"owner{o}@example.com"}
+            for o in range(owners)
+        ]
+
+        self.deals = []
+        for d in range(deals):
+            created = base + timedelta(minutes=d * 7)
+            modified = created + timedelta(hours=rng.randint(0, 240))
+            pipeline, stage = rng.choice(stage_ids)
+            self.deals.append({
+                "id": str(1000000 + d),
+                "properties": {
+                    "dealname": f"Negócio {d}",
+                    "createdate": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "hs_lastmodifieddate": modified.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "dealstage": stage,
+                    "pipeline": pipeline,
+                    "amount": f"{rng.uniform(100, 50000):.2f}",
+                    "hubspot_owner_id": rng.choice(self.owners)["id"] if owners else None,
+                    "data_agendamento": (created + timedelta(days=rng.randint(1, 30))).strftime("%Y-%m-%d"),
+                    "hs_analytics_source": rng.choice(["ORGANIC_SEARCH", "PAID_SEARCH", "DIRECT_TRAFFIC"]),
+                    "hs_analytics_source_data_1": rng.choice(["google", "facebook", "email"]),
+                    "description": "Detalhes " * rng.randint(0, 20),
+                },
+                "_modified_ms": int(modified.timestamp() * 1000),
+            })
+        self.deals.sort(key=lambda deal: deal["_modified_ms"])
+
+
+class MockHubSpotServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data, rate_limit=100, interval_ms=10000, latency=0.0):
+        super().__init__(address, MockHubSpotHandler)
+        self.data = data
+        self.rate_limit = rate_limit
+        self.interval_ms = interval_ms
+        self.latency = latency
+        self.requests = 0
+        self.throttled = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def take_slot(self):
+        """Janela deslizante no estilo do HubSpot; devolve o número de chamadas restantes ou None se estourou"""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            while self._window and now - self._window[0] > self.interval_ms / 1000:
+                self._window.popleft()
+            if len(self._window) >= self.rate_limit:
+                self.throttled += 1
+                return None
+            self._window.append(now)
+            return self.rate_limit - len(self._window)
+
+
+def _page(items, limit, after):
+    start = int(after or 0)
+    limit = max(1, min(int(limit or 100), 100))
+    chunk = items[start:start + limit]
+    body = {"results": chunk}
+    if start + limit < len(items):
+        body["paging"] = {"next": {"after": str(start + limit)}}
+    return body
+
+
+def _public_deal(deal, properties=None):
+    props = deal["properties"]
+    if properties:
+        props = {k: v for k, v in props.items() if k in properties}
+    return {"id": deal["id"], "properties": props, "archived": False}
+
+
+class MockHubSpotHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, remaining):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-HubSpot-RateLimit-Max", str(self.server.rate_limit))
+        self.send_header("X-HubSpot-RateLimit-Remaining", str(max(remaining, 0)))
+        self.send_header("X-HubSpot-RateLimit-Interval-Milliseconds", str(self.server.interval_ms))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        remaining = self.server.take_slot()
+        if remaining is None:
+            return self._send(429, {"status": "error", "category": "RATE_LIMITS"}, 0)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        data = self.server.data
+
+        if method == "GET" and url.path == "/crm/v3/owners":
+            return self._send(200, _page(data.owners, query.get("limit"), query.get("after")), remaining)
+
+        if method == "GET" and url.path == "/crm/v3/pipelines/deals":
+            return self._send(200, {"results": data.pipelines}, remaining)
+
+        if method == "GET" and url.path == "/crm/v3/objects/deals":
+            properties = query.get("properties", "").split(",") if query.get("properties") else None
+            body = _page(data.deals, query.get("limit"), query.get("after"))
+            body["results"] = [_public_deal(d, properties) for d in body["results"]]
+            return self._send(200, body, remaining)
+
+        if method == "POST" and url.path == "/crm/v3/objects/deals/search":
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            deals = data.deals
+            for group in request.get("filterGroups", [])[:1]:
+                for f in group.get("filters", []):
+                    if f.get("propertyName") != "hs_lastmodifieddate":
+                        continue
+                    value = int(f["value"])
+                    if f["operator"] == "GTE":
+                        deals = [d for d in deals if d["_modified_ms"] >= value]
+                    elif f["operator"] == "LT":
+                        deals = [d for d in deals if d["_modified_ms"] < value]
+            body = _page(deals, request.get("limit"), request.get("after"))
+            body["total"] = len(deals)
+            body["results"] = [_public_deal(d, request.get("properties")) for d in body["results"]]
+            return self._send(200, body, remaining)
+
+        return self._send(404, {"status": "error", "message": f"Unknown route {url.path}"}, remaining)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def start_mock_server(port=0, data=None, **kwargs):
+    """Sobe o mock numa thread daemon e devolve (server, base_url)"""
+    server = MockHubSpotServer(("127.0.0.1", port), data or MockHubSpotData(), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor HubSpot falso para testes e benchmarks")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--deals", type=int, default=10000)
+    parser.add_argument("--owners", type=int, default=20)
+    parser.add_argument("--rate-limit", type=int, default=100, help="Chamadas por janela")
+    parser.add_argument("--interval-ms", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latência artificial por chamada (s)")
+    args = parser.parse_args(argv)
+
+    data = MockHubSpotData(deals=args.deals, owners=args.owners)
+    server = MockHubSpotServer(
+        ("0.0.0.0", args.port), data,
+        rate_limit=args.rate_limit, interval_ms=args.interval_ms, latency=args.latency
+    )
+    logger.info(f"Mock HubSpot ouvindo em http://0.0.0.0:{args.port} ({args.deals} deals)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,223 @@
+# src/quality.py
+import uuid
+from functools import lru_cache
+from psycopg2 import sql
+from src.logger import logger
+from src.sql import compose, ident
+
+DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}$'
+VALOR_PATTERN = r'^-?[0-9]*\.?[0-9]+$'
+
+FATO_DEAL_COLUMNS = [
+    "deal_id", "data_negocio_criado", "data_agendamento", "nome_negocio",
+    "etapa_id", "valor", "funil", "origem", "canal", "detalhes", "owner_id"
+]
+# Colunas de texto livre que FACT_SPLIT_TEXT move para a tabela lateral
+FATO_DEAL_TEXT_COLUMNS = ["nome_negocio", "detalhes"]
+FATO_DEAL_DATE_COLUMNS = ["data_negocio_criado", "data_agendamento"]
+FATO_DEAL_KEY_COLUMNS = ["deal_id", "etapa_id", "owner_id"]
+
+
+@lru_cache(maxsize=None)
+def valid_date(column):
+    """Texto da data quando ela é convertível para DATE, senão NULL.
+
+    O regex sozinho aceita datas como 2020-13-45, que abortariam o ::DATE;
+    os CASE aninhados garantem a ordem de avaliação das verificações.
+    """
+    return sql.SQL("""CASE WHEN {col} ~ {pattern} THEN
+            CASE WHEN substr({col}, 1, 4)::INT >= 1 AND substr({col}, 6, 2)::INT BETWEEN 1 AND 12 THEN
+                CASE WHEN substr({col}, 9, 2)::INT BETWEEN 1 AND EXTRACT(DAY FROM
+                    make_date(substr({col}, 1, 4)::INT, substr({col}, 6, 2)::INT, 1) + INTERVAL '1 month - 1 day')
+                THEN {col} END
+            END
+        END""").format(col=ident(column), pattern=sql.Literal(DATE_PATTERN))
+
+
+class DataQualityError(Exception):
+    """Raised when a profile breaches the configured thresholds"""
+
+    def __init__(self, run_id, breaches):
+        self.run_id = run_id
+        self.breaches = breaches
+        details = "; ".join(
+            f"{b['column_name'] or '*'}.{b['metric']}={b['value']} (limit {b['threshold']})"
+            for b in breaches
+        )
+        super().__init__(f"Data quality thresholds breached in run {run_id}: {details}")
+
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+
+def create_dq_profile_table(db, conn):
+    """Cria a tabela de perfis de qualidade de forma idempotente"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(compose("""
+            CREATE TABLE IF NOT EXISTS {dq_profile} (
+                run_id TEXT NOT NULL,
+                profiled_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                table_name TEXT NOT NULL,
+                column_name TEXT,
+                metric TEXT NOT NULL,
+                value NUMERIC,
+                value_text TEXT,
+                threshold NUMERIC,
+                breached BOOLEAN NOT NULL DEFAULT FALSE
+            );
+            CREATE INDEX IF NOT EXISTS dq_profile_run_id_idx
+                ON {dq_profile} (run_id);
+            """, dq_profile=db.config.dq_profile_table))
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Erro ao criar tabela de perfil de qualidade: {e}")
+        raise
+
+
+@lru_cache(maxsize=None)
+def build_fato_deal_profile_query(table_name, text_table=None):
+    """Monta uma única agregação com todas as métricas da tabela fato (colunas TEXT).
+
+    Com text_table (FACT_SPLIT_TEXT) os nulos de nome_negocio/detalhes são
+    contados na tabela lateral, agregada no mesmo comando.
+    """
+    selects = [sql.SQL("COUNT(*) AS row_count")]
+    text_selects = []
+
+    for column in FATO_DEAL_COLUMNS:
+        if text_table and column in FATO_DEAL_TEXT_COLUMNS:
+            text_selects.append(sql.SQL(f"COUNT(*) FILTER (WHERE NULLIF({column}, '') IS NULL) AS {column}__null_count"))
+            continue
+        selects.append(sql.SQL(f"COUNT(*) FILTER (WHERE NULLIF({column}, '') IS NULL) AS {column}__null_count"))
+
+    for column in FATO_DEAL_KEY_COLUMNS:
+        selects.append(sql.SQL(f"COUNT(DISTINCT NULLIF({column}, '')) AS {column}__distinct_count"))
+
+    for column in FATO_DEAL_DATE_COLUMNS:
+        # Inválida = preenchida mas não convertível (inclui as que passam no regex)
+        valid = valid_date(column)
+        selects.append(sql.SQL(
+            f"COUNT(*) FILTER (WHERE NULLIF({column}, '') IS NOT NULL AND ({{valid}}) IS NULL) AS {column}__invalid_count"
+        ).format(valid=valid))
+        selects.append(sql.SQL(f"MIN({{valid}}) AS {column}__min").format(valid=valid))
+        selects.append(sql.SQL(f"MAX({{valid}}) AS {column}__max").format(valid=valid))
+
+    cleaned_valor = "regexp_replace(valor, '[^0-9.-]', '', 'g')"
+    selects.append(sql.SQL(
+        f"COUNT(*) FILTER (WHERE NULLIF(valor, '') IS NOT NULL "
+        f"AND {cleaned_valor} !~ %(valor_pattern)s) AS valor__invalid_count"
+    ))
+    selects.append(sql.SQL(f"MIN(CASE WHEN {cleaned_valor} ~ %(valor_pattern)s THEN {cleaned_valor}::NUMERIC END) AS valor__min"))
+    selects.append(sql.SQL(f"MAX(CASE WHEN {cleaned_valor} ~ %(valor_pattern)s THEN {cleaned_valor}::NUMERIC END) AS valor__max"))
+
+    query = sql.SQL("SELECT\n    {}\nFROM {}").format(sql.SQL(",\n    ").join(selects), ident(table_name))
+    if text_selects:
+        text_query = sql.SQL("SELECT\n    {}\nFROM {}").format(sql.SQL(",\n    ").join(text_selects), ident(text_table))
+        query = sql.SQL("SELECT * FROM ({}) f CROSS JOIN ({}) t").format(query, text_query)
+    return query
+
+
+def _thresholds(config):
+    """Limites configurados por (coluna, métrica) expressos como taxa sobre o total de linhas"""
+    thresholds = {
+        ("deal_id", "null_rate"): config.DQ_MAX_KEY_NULL_RATE,
+        ("deal_id", "duplicate_rate"): config.DQ_MAX_DUPLICATE_RATE,
+        ("valor", "invalid_rate"): config.DQ_MAX_INVALID_VALOR_RATE,
+    }
+    for column in FATO_DEAL_DATE_COLUMNS:
+        thresholds[(column, "invalid_rate")] = config.DQ_MAX_INVALID_DATE_RATE
+    return thresholds
+
+
+def _profile_rows(row_count, metrics, config):
+    """Converte o resultado da agregação em linhas (coluna, métrica, valor)"""
+    rows = [(None, "row_count", row_count, None)]
+    for key, value in metrics.items():
+        column, metric = key.split("__", 1)
+        if metric in ("min", "max"):
+            rows.append((column, metric, None, None if value is None else str(value)))
+            continue
+        rows.append((column, metric, value, None))
+        rate = (value / row_count) if row_count else 0
+        if metric == "null_count":
+            rows.append((column, "null_rate", rate, None))
+        elif metric == "invalid_count":
+            rows.append((column, "invalid_rate", rate, None))
+        elif metric == "distinct_count" and column == "deal_id":
+            non_null = row_count - metrics["deal_id__null_count"]
+            duplicates = non_null - value
+            rows.append((column, "duplicate_count", duplicates, None))
+            rows.append((column, "duplicate_rate", (duplicates / row_count) if row_count else 0, None))
+
+    thresholds = _thresholds(config)
+    profile = []
+    for column, metric, value, value_text in rows:
+        threshold = thresholds.get((column, metric))
+        breached = threshold is not None and value is not None and value > threshold
+        profile.append({
+            "column_name": column,
+            "metric": metric,
+            "value": value,
+            "value_text": value_text,
+            "threshold": threshold,
+            "breached": breached,
+        })
+
+    if row_count < config.DQ_MIN_ROWS:
+        profile.append({
+            "column_name": None,
+            "metric": "min_rows",
+            "value": row_count,
+            "value_text": None,
+            "threshold": config.DQ_MIN_ROWS,
+            "breached": True,
+        })
+    return profile
+
+
+def profile_fato_deal(db, conn, table_name, run_id=None, text_table=None):
+    """Perfila a carga recém-feita em uma única passada e grava o resultado em dq_profile.
+
+    text_table é a tabela lateral de textos quando a fato é gravada separada.
+    Retorna a lista de métricas; as que violam os limites vêm com breached=True.
+    """
+    run_id = run_id or new_run_id()
+    create_dq_profile_table(db, conn)
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                build_fato_deal_profile_query(table_name, text_table),
+                {"valor_pattern": VALOR_PATTERN}
+            )
+            columns = [desc[0] for desc in cursor.description]
+            values = dict(zip(columns, cursor.fetchone()))
+            row_count = values.pop("row_count")
+            profile = _profile_rows(row_count, values, db.config)
+
+            cursor.executemany(compose("""
+            INSERT INTO {dq_profile}
+                (run_id, table_name, column_name, metric, value, value_text, threshold, breached)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, dq_profile=db.config.dq_profile_table), [
+                (run_id, db.config.fato_deal_target, p["column_name"], p["metric"],
+                 p["value"], p["value_text"], p["threshold"], p["breached"])
+                for p in profile
+            ])
+            conn.commit()
+        logger.info(f"Perfil de qualidade {run_id} gravado: {row_count} linhas em {table_name}")
+        return profile
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Falha ao perfilar {table_name}: {e}")
+        raise
+
+
+def check_profile(profile, run_id):
+    """Bloqueia a publicação se alguma métrica violar o limite configurado"""
+    breaches = [p for p in profile if p["breached"]]
+    if breaches:
+        raise DataQualityError(run_id, breaches)
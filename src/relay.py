@@ -0,0 +1,105 @@
+# src/relay.py
+import os
+import re
+import logging
+import selectors
+import subprocess
+from collections import deque, namedtuple
+from src.logger import logger
+
+# Formato emitido por src.logger nos processos filhos
+LOG_LINE = re.compile(
+    r'^\d{4}-\d{2}-\d{2} [\d:,]+ - \S+ - (DEBUG|INFO|WARNING|ERROR|CRITICAL) - (.*)$'
+)
+
+READ_SIZE = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024
+
+RelayResult = namedtuple("RelayResult", ["returncode", "stderr_tail"])
+
+
+def _emit(name, stream_name, raw_line):
+    """Reencaminha uma linha do filho como registro de log do processo pai"""
+    line = raw_line.decode("utf-8", errors="replace").rstrip("\r")
+    if not line.strip():
+        return None
+
+    match = LOG_LINE.match(line)
+    if match:
+        level = logging.getLevelName(match.group(1))
+        message = match.group(2)
+    else:
+        level = logging.ERROR if stream_name == "stderr" else logging.INFO
+        message = line
+
+    logger.log(
+        level,
+        f"[{name.upper()}] {message}",
+        extra={"child": name, "stream": stream_name}
+    )
+    return line
+
+
+def relay_process(cmd, name, cwd=None, env=None, tail_lines=50):
+    """Executa um subprocesso e reencaminha stdout/stderr linha a linha.
+
+    Os dois pipes são multiplexados com selectors, então um stream quieto
+    não trava o outro e o filho nunca bloqueia com o pipe cheio. A memória
+    fica limitada ao buffer de uma linha por stream mais as últimas
+    `tail_lines` linhas de stderr, devolvidas para diagnóstico.
+    """
+    child_env = dict(os.environ if env is None else env)
+    child_env.setdefault("PYTHONUNBUFFERED", "1")
+
+    process = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=child_env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stderr_tail = deque(maxlen=tail_lines)
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+    selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+    pending = {"stdout": b"", "stderr": b""}
+
+    def forward(stream_name, raw_line):
+        line = _emit(name, stream_name, raw_line)
+        if line is not None and stream_name == "stderr":
+            stderr_tail.append(line)
+
+    try:
+        while selector.get_map():
+            for key, _ in selector.select():
+                stream_name = key.data
+                chunk = os.read(key.fd, READ_SIZE)
+
+                if not chunk:
+                    # EOF: descarrega o que sobrou sem quebra de linha
+                    selector.unregister(key.fileobj)
+                    if pending[stream_name]:
+                        forward(stream_name, pending[stream_name])
+                        pending[stream_name] = b""
+                    continue
+
+                *lines, rest = (pending[stream_name] + chunk).split(b"\n")
+                for raw_line in lines:
+                    forward(stream_name, raw_line)
+
+                # Linhas gigantes são reencaminhadas em pedaços para manter a memória limitada
+                while len(rest) > MAX_LINE_BYTES:
+                    forward(stream_name, rest[:MAX_LINE_BYTES])
+                    rest = rest[MAX_LINE_BYTES:]
+                pending[stream_name] = rest
+
+        returncode = process.wait()
+    finally:
+        selector.close()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+    return RelayResult(returncode, list(stderr_tail))
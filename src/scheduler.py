@@ -0,0 +1,242 @@
+# src/scheduler.py
+import json
+import time
+import random
+from datetime import datetime, timedelta
+from src.config import Config
+from src.database import Database
+from src.health import RunState, start_health_server
+from src.lease import REUSED
+from src.logger import logger
+from src.sql import compose
+
+
+def _normalize(snapshot):
+    """Fingerprint em forma comparável com o JSON persistido"""
+    return {name: list(fp) for name, fp in snapshot.items()}
+
+
+class ChangeDetector:
+    """Checkpoint de cada estágio: fingerprint das entradas e quando concluiu.
+
+    O estado fica na tabela de run-state, então uma nova tentativa (ou um
+    processo reiniciado) retoma no primeiro estágio incompleto ou invalidado.
+    Sem acesso ao banco cai para o estado em memória.
+    """
+
+    def __init__(self, db, pipeline="pipeline"):
+        self.db = db
+        self.pipeline = pipeline
+        self._processed = {}
+        self._loaded = False
+        self._table_ready = False
+
+    def snapshot(self, table_names):
+        """Fingerprint atual das tabelas; None quando não foi possível obtê-lo"""
+        try:
+            with self.db.get_connection() as conn:
+                return self.db.get_table_fingerprints(conn, table_names)
+        except Exception as e:
+            logger.warning(f"Fingerprint indisponível, processando mesmo assim: {e}")
+            return None
+
+    def _execute(self, query, params=()):
+        with self.db.get_connection() as conn:
+            if not self._table_ready:
+                create_run_state_table(self.db, conn)
+            with conn.cursor() as cursor:
+                cursor.execute(compose(query, run_state=self.db.config.run_state_table), params)
+                rows = cursor.fetchall() if cursor.description else None
+            conn.commit()
+            self._table_ready = True
+            return rows
+
+    def _load(self):
+        if self._loaded:
+            return
+        try:
+            rows = self._execute("""
+            SELECT stage, fingerprint, EXTRACT(EPOCH FROM completed_at)
+            FROM {run_state}
+            WHERE pipeline = %s AND status = 'completed'
+            """, (self.pipeline,))
+            self._processed = {stage: (fingerprint, float(completed_at)) for stage, fingerprint, completed_at in rows}
+            self._loaded = True
+        except Exception as e:
+            logger.warning(f"Run-state indisponível, usando checkpoints em memória: {e}")
+
+    def changed(self, key, snapshot, depends_on=(), max_age=None):
+        """True se o estágio precisa rodar: entradas mudaram, nunca concluiu,
+        um estágio anterior concluiu depois dele ou o checkpoint passou de max_age"""
+        self._load()
+        if snapshot is None or any(fp is None for fp in snapshot.values()):
+            return True
+        record = self._processed.get(key)
+        if record is None or record[0] != _normalize(snapshot):
+            return True
+        completed_at = record[1]
+        for upstream in depends_on:
+            upstream_record = self._processed.get(upstream)
+            if upstream_record and upstream_record[1] > completed_at:
+                logger.info(f"{key} invalidado: {upstream} concluiu depois")
+                return True
+        return max_age is not None and time.time() - completed_at >= max_age
+
+    def begin(self, key, run_id=None):
+        """Marca o estágio como em andamento; até o commit ele conta como incompleto"""
+        self._processed.pop(key, None)
+        try:
+            self._execute("""
+            INSERT INTO {run_state} (pipeline, stage, status, run_id, started_at)
+            VALUES (%s, %s, 'running', %s, now())
+            ON CONFLICT (pipeline, stage) DO UPDATE SET
+                status = 'running',
+                run_id = EXCLUDED.run_id,
+                started_at = EXCLUDED.started_at,
+                error = NULL
+            """, (self.pipeline, key, run_id))
+        except Exception as e:
+            logger.warning(f"Não foi possível registrar início de {key}: {e}")
+
+    def fail(self, key, error=None):
+        try:
+            self._execute("""
+            UPDATE {run_state}
+            SET status = 'failed', error = %s, duration = EXTRACT(EPOCH FROM now() - started_at)
+            WHERE pipeline = %s AND stage = %s
+            """, (error, self.pipeline, key))
+        except Exception as e:
+            logger.warning(f"Não foi possível registrar falha de {key}: {e}")
+
+    def release(self, key):
+        """Encerra o estágio sem checkpoint quando o resultado veio de outro processo.
+
+        O snapshot local foi tirado depois que o holder começou a ler a origem,
+        então gravá-lo marcaria como feitas alterações que a reconstrução
+        reaproveitada não viu. O checkpoint fica com quem reconstruiu.
+        """
+        # Relê os checkpoints na próxima verificação para enxergar o do holder
+        self._loaded = False
+        try:
+            self._execute("""
+            UPDATE {run_state}
+            SET status = 'reused', duration = EXTRACT(EPOCH FROM now() - started_at)
+            WHERE pipeline = %s AND stage = %s AND status = 'running'
+            """, (self.pipeline, key))
+        except Exception as e:
+            logger.warning(f"Não foi possível liberar {key}: {e}")
+
+    def commit(self, key, snapshot):
+        if snapshot is None:
+            return
+        fingerprint = _normalize(snapshot)
+        completed_at = time.time()
+        self._processed[key] = (fingerprint, completed_at)
+        try:
+            self._execute("""
+            INSERT INTO {run_state} AS rs (pipeline, stage, status, fingerprint, started_at, completed_at, duration)
+            VALUES (%s, %s, 'completed', %s, now(), to_timestamp(%s), 0)
+            ON CONFLICT (pipeline, stage) DO UPDATE SET
+                status = 'completed',
+                fingerprint = EXCLUDED.fingerprint,
+                completed_at = EXCLUDED.completed_at,
+                duration = EXTRACT(EPOCH FROM EXCLUDED.completed_at - rs.started_at),
+                error = NULL
+            """, (self.pipeline, key, json.dumps(fingerprint), completed_at))
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar checkpoint de {key}: {e}")
+
+
+def create_run_state_table(db, conn):
+    with conn.cursor() as cursor:
+        cursor.execute(compose("""
+        CREATE SCHEMA IF NOT EXISTS {schema};
+        CREATE TABLE IF NOT EXISTS {run_state} (
+            pipeline TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            fingerprint JSONB,
+            run_id TEXT,
+            started_at TIMESTAMPTZ,
+            completed_at TIMESTAMPTZ,
+            duration DOUBLE PRECISION,
+            error TEXT,
+            PRIMARY KEY (pipeline, stage)
+        );""", schema=db.config.TARGET_SCHEMA, run_state=db.config.run_state_table))
+
+
+class AdaptiveScheduler:
+    """Intervalo que encurta quando a origem muda e alonga quando fica parada.
+
+    Falhas usam backoff exponencial com jitter em vez de uma espera fixa.
+    """
+
+    def __init__(self, name, base_interval, failure_interval, config=None):
+        self.name = name
+        self.config = config or Config()
+        self.min_interval = min(self.config.SCHEDULER_MIN_INTERVAL, base_interval)
+        self.max_interval = max(self.config.SCHEDULER_MAX_INTERVAL, base_interval)
+        self.failure_interval = failure_interval
+        self.interval = base_interval
+        self.failures = 0
+        self.last_duration = 0
+        self.last_run = None
+
+    def record_run(self, success, duration):
+        self.last_duration = duration
+        if success:
+            self.failures = 0
+            self.last_run = time.time()
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.failures += 1
+
+    def record_skip(self):
+        self.interval = min(self.max_interval, self.interval * 1.5)
+
+    def next_interval(self):
+        if self.failures:
+            backoff = min(
+                self.config.SCHEDULER_MAX_BACKOFF,
+                self.failure_interval * 2 ** (self.failures - 1)
+            )
+            return backoff / 2 + random.uniform(0, backoff / 2)
+        # Nunca agenda execuções mais próximas que o dobro da última duração
+        return max(self.interval, 2 * self.last_duration)
+
+    def sleep(self):
+        wait_time = int(self.next_interval())
+        next_run = datetime.now() + timedelta(seconds=wait_time)
+        logger.info(f"⏳ [{self.name.upper()}] Next check in {wait_time}s at {next_run.strftime('%H:%M:%S')}")
+        time.sleep(wait_time)
+
+
+def run_scheduled(name, run_once, sources, base_interval, failure_interval):
+    """Loop de drone: só executa run_once quando as tabelas de origem mudaram"""
+    detector = ChangeDetector(Database())
+    scheduler = AdaptiveScheduler(name, base_interval, failure_interval)
+    state = RunState(name)
+    start_health_server(state.status)
+
+    while True:
+        snapshot = detector.snapshot(sources)
+        if detector.changed(name, snapshot, max_age=scheduler.config.SCHEDULER_FORCE_REFRESH):
+            start = time.time()
+            state.run_started()
+            detector.begin(name)
+            with state.stage(name):
+                outcome = run_once()
+            success = bool(outcome)
+            scheduler.record_run(success, time.time() - start)
+            state.run_finished(success, time.time() - start)
+            if outcome == REUSED:
+                detector.release(name)
+            elif success:
+                detector.commit(name, snapshot)
+            else:
+                detector.fail(name)
+        else:
+            logger.info(f"⏭ [{name.upper()}] Source unchanged, skipping run")
+            scheduler.record_skip()
+            state.record_skip()
+        scheduler.sleep()
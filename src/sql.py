@@ -0,0 +1,100 @@
+# src/sql.py
+import re
+import hashlib
+import weakref
+from functools import lru_cache
+from psycopg2 import sql
+
+# Statements preparados por conexão (somem junto com a sessão)
+_prepared = weakref.WeakKeyDictionary()
+_prepare_texts = {}
+
+
+def ident(name):
+    """'schema.tabela' -> identificador qualificado e escapado"""
+    return sql.Identifier(*name.split('.'))
+
+
+def columns(names):
+    """Lista de colunas escapadas, para nomes vindos de fora (ex.: cabeçalho de CSV)"""
+    return sql.SQL(", ").join(sql.Identifier(name) for name in names)
+
+
+def as_sql(query):
+    """Aceita tanto SQL composto quanto texto literal (consultas construídas fora deste módulo)"""
+    return query if isinstance(query, sql.Composable) else sql.SQL(query)
+
+
+@lru_cache(maxsize=None)
+def compose(template, **tables):
+    """Template com {nome} para identificadores de tabela, compilado uma vez por combinação"""
+    return sql.SQL(template).format(**{key: ident(value) for key, value in tables.items()})
+
+
+# Trechos onde %s não é placeholder (literais, identificadores entre aspas,
+# dollar quoting e comentários), além dos próprios %% e %s
+_PLACEHOLDER_TOKENS = re.compile(r"""
+    [eE]'(?:[^'\\]|\\.|'')*'
+  | '(?:[^']|'')*'
+  | "(?:[^"]|"")*"
+  | \$([A-Za-z_]\w*|)\$.*?\$\1\$
+  | --[^\n]*
+  | /\*.*?\*/
+  | %%
+  | %s
+""", re.S | re.X)
+
+
+def _numbered_placeholders(text):
+    """Converte os placeholders do psycopg2 em $1..$n, como o servidor espera no PREPARE.
+
+    Só %s fora de literais e comentários vira parâmetro; %% volta a ser %
+    (o escape que o psycopg2 desfaria ao receber parâmetros).
+    """
+    counter = iter(range(1, text.count("%s") + 1))
+
+    def replace(match):
+        token = match.group(0)
+        if token == "%s":
+            return f"${next(counter)}"
+        return token.replace("%%", "%")
+
+    return _PLACEHOLDER_TOKENS.sub(replace, text)
+
+
+def _prepare_text(conn, statement, bind=True):
+    """Nome estável + texto do PREPARE (com bind=True, placeholders %s viram $1..$n)"""
+    key = (id(statement), bind)
+    cached = _prepare_texts.get(key)
+    if cached is None or cached[0] is not statement:
+        text = statement.as_string(conn)
+        # Sem parâmetros o psycopg2 envia o texto como está, então ele não é reescrito
+        prepared = _numbered_placeholders(text) if bind else text
+        name = "etl_" + hashlib.md5(prepared.encode("utf-8")).hexdigest()[:16]
+        cached = (statement, name, prepared)
+        _prepare_texts[key] = cached
+    return cached[1], cached[2]
+
+
+def execute_prepared(cursor, statement, params=(), use_prepared=True):
+    """Executa via PREPARE/EXECUTE, preparando na primeira chamada de cada conexão.
+
+    use_prepared vem do DB_USE_PREPARED da configuração dona da conexão; com
+    False (ex.: pgbouncer em modo transação) executa direto.
+    """
+    if not use_prepared:
+        cursor.execute(statement, params or None)
+        return cursor
+
+    conn = cursor.connection
+    name, text = _prepare_text(conn, statement, bind=bool(params))
+    names = _prepared.setdefault(conn, set())
+    if name not in names:
+        cursor.execute(f"PREPARE {name} AS {text}")
+        names.add(name)
+
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
+    return cursor
@@ -0,0 +1,218 @@
+# src/tenants.py
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.config import Config
+from src.database import Database
+from src.health import RunState, start_health_server
+from src.logger import logger, tenant_context
+from src.scheduler import AdaptiveScheduler
+
+# Chaves do tenant que não são configurações do Config
+TENANT_OPTIONS = ("name", "max_concurrency", "base_interval", "failure_interval", "settings")
+
+
+class TenantMetrics:
+    """Contadores por tenant, atualizados pelo scheduler a cada execução"""
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.skips = 0
+        self.stages_run = 0
+        self.last_duration = None
+        self.total_duration = 0.0
+        self.max_queue_wait = 0.0
+        self.last_started_at = None
+        self.last_success_at = None
+        self.last_error = None
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class Tenant:
+    """Um portal do HubSpot com banco, schemas e credenciais próprios"""
+
+    def __init__(self, name, settings=None, max_concurrency=1, base_interval=3600, failure_interval=300):
+        self.name = name
+        self.settings = {key: _expand(value) for key, value in (settings or {}).items()}
+        # Snapshots de cada tenant vão para um subdiretório próprio, salvo configuração explícita
+        self.settings.setdefault("EXPORT_DIR", os.path.join(Config.EXPORT_DIR, name))
+        self.config = Config.with_overrides(self.settings)
+        self.env = {**os.environ, **{key: str(value) for key, value in self.settings.items()}}
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.scheduler = AdaptiveScheduler(name, base_interval, failure_interval, self.config)
+        self.metrics = TenantMetrics()
+        self.next_due = 0.0
+        self.running = False
+
+    @classmethod
+    def from_dict(cls, entry):
+        unknown = [key for key in entry if key not in TENANT_OPTIONS and not key.isupper()]
+        if unknown:
+            raise ValueError(f"Opções desconhecidas no tenant {entry.get('name')}: {unknown}")
+        settings = dict(entry.get("settings", {}))
+        settings.update({key: value for key, value in entry.items() if key.isupper()})
+        options = {key: entry[key] for key in TENANT_OPTIONS if key in entry and key != "settings"}
+        return cls(settings=settings, **options)
+
+
+def _expand(value):
+    """Permite referenciar segredos do ambiente, ex.: "${PORTAL_A_DB_PASSWORD}" """
+    return os.path.expandvars(value) if isinstance(value, str) else value
+
+
+def load_tenants(path):
+    """Lê a lista de tenants de um arquivo JSON (lista de objetos com "name")"""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    tenants = [Tenant.from_dict(entry) for entry in entries]
+    names = [tenant.name for tenant in tenants]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"Tenants duplicados: {duplicated}")
+    return tenants
+
+
+class TenantScheduler:
+    """Executa o pipeline de todos os tenants num pool compartilhado e limitado.
+
+    Cada tenant tem no máximo uma execução em andamento (max_concurrency limita
+    quantos estágios dela rodam ao mesmo tempo). Quando há mais tenants vencidos
+    que workers livres, sai primeiro quem está esperando há mais tempo, então um
+    portal lento ou com falhas em sequência não atrasa os demais.
+    """
+
+    def __init__(self, tenants, pipeline_factory, workers=None):
+        self.tenants = tenants
+        self.pipeline_factory = pipeline_factory
+        self.workers = workers or Config.TENANT_WORKERS
+        self._pipelines = {}
+        self._lock = threading.Lock()
+
+    def _pipeline(self, tenant):
+        if tenant.name not in self._pipelines:
+            self._pipelines[tenant.name] = self.pipeline_factory(
+                db=Database(tenant.config), env=tenant.env, parallelism=tenant.max_concurrency,
+                state=RunState(tenant.name)
+            )
+        return self._pipelines[tenant.name]
+
+    def _run_tenant(self, tenant, due):
+        metrics = tenant.metrics
+        start = time.time()
+        with self._lock:
+            metrics.last_started_at = start
+            metrics.max_queue_wait = max(metrics.max_queue_wait, start - due)
+
+        with tenant_context(tenant.name):
+            try:
+                pipeline = self._pipeline(tenant)
+                success = pipeline.run()
+                error = None if success else "pipeline failed"
+            except Exception as e:
+                logger.error(f"❌ Tenant run crashed: {e}")
+                pipeline, success, error = None, False, str(e)
+
+        duration = time.time() - start
+        stages_run = getattr(pipeline, "stages_run", 0) if pipeline else 0
+        with self._lock:
+            metrics.runs += 1
+            metrics.last_duration = duration
+            metrics.total_duration += duration
+            metrics.stages_run += stages_run
+            if success and stages_run == 0:
+                metrics.skips += 1
+                tenant.scheduler.record_skip()
+            else:
+                tenant.scheduler.record_run(success, duration)
+            if success:
+                metrics.last_success_at = time.time()
+                metrics.last_error = None
+            else:
+                metrics.failures += 1
+                metrics.last_error = error
+            tenant.next_due = time.time() + tenant.scheduler.next_interval()
+            tenant.running = False
+
+        logger.info(
+            f"📊 [{tenant.name}] {'ok' if success else 'failed'} in {duration:.1f}s, "
+            f"{stages_run} stages; runs={metrics.runs} failures={metrics.failures} "
+            f"skips={metrics.skips}; next in {tenant.next_due - time.time():.0f}s"
+        )
+        return success
+
+    def _due_tenants(self, now):
+        with self._lock:
+            due = [t for t in self.tenants if not t.running and t.next_due <= now]
+        # Mais atrasado primeiro; em empate, quem foi atendido há mais tempo
+        return sorted(due, key=lambda t: (t.next_due, t.metrics.last_started_at or 0))
+
+    def metrics(self):
+        """Métricas por tenant (inclui quando vence a próxima execução)"""
+        with self._lock:
+            return {
+                tenant.name: {
+                    **tenant.metrics.as_dict(),
+                    "running": tenant.running,
+                    "next_due_at": tenant.next_due,
+                }
+                for tenant in self.tenants
+            }
+
+    def status(self):
+        """Saudável quando todos os tenants tiveram uma execução bem-sucedida recente"""
+        now = time.time()
+        tenants = self.metrics()
+        for name, values in tenants.items():
+            pipeline = self._pipelines.get(name)
+            values["current_stage"] = getattr(getattr(pipeline, "state", None), "current_stage", None)
+            last = values["last_success_at"]
+            values["freshness_lag"] = None if last is None else now - last
+        healthy = all(
+            values["freshness_lag"] is not None and values["freshness_lag"] <= Config.HEALTH_MAX_STALENESS
+            for values in tenants.values()
+        )
+        return healthy, {"name": "tenants", "status": "ok" if healthy else "stale", "tenants": tenants}
+
+    def run(self, stop=None, max_runs=None):
+        """Loop principal; encerra com `stop` (threading.Event) ou após `max_runs` execuções de cada tenant"""
+        stop = stop or threading.Event()
+        logger.info(f"🏢 Running {len(self.tenants)} tenants with {self.workers} workers")
+        futures = set()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tenant") as executor:
+            while not stop.is_set():
+                now = time.time()
+                for tenant in self._due_tenants(now):
+                    if len(futures) >= self.workers:
+                        break
+                    if max_runs and tenant.metrics.runs >= max_runs:
+                        continue
+                    with self._lock:
+                        tenant.running = True
+                    futures.add(executor.submit(self._run_tenant, tenant, tenant.next_due or now))
+
+                if not futures and max_runs and all(t.metrics.runs >= max_runs for t in self.tenants):
+                    break
+
+                with self._lock:
+                    idle = [t.next_due for t in self.tenants if not t.running]
+                timeout = max(0.5, min(idle) - time.time()) if idle else 5
+                if futures:
+                    _, futures = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    stop.wait(timeout)
+
+        return self.metrics()
+
+
+def run_tenants(path, pipeline_factory, workers=None, max_runs=None):
+    """Carrega os tenants do arquivo e roda o scheduler compartilhado"""
+    tenants = load_tenants(path)
+    scheduler = TenantScheduler(tenants, pipeline_factory, workers)
+    start_health_server(scheduler.status)
+    return scheduler.run(max_runs=max_runs)